@@ -14,6 +14,11 @@ CREATE TABLE IF NOT EXISTS guilds (
   name TEXT NOT NULL,
   icon TEXT,
 
+  -- Content hashes of the role and channel rows last synced by the bot
+  -- Cleared whenever individual rows are changed, which forces a full sync
+  roles_hash TEXT,
+  channels_hash TEXT,
+
   removed_at TIMESTAMP  -- Used to delete data after an inactivity timeout
 );
 
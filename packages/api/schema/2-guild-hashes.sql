@@ -0,0 +1,5 @@
+-- Adds the content hashes of guilds created before 0-common.sql defined them
+-- This file only uses IF NOT EXISTS and can be run against existing databases
+
+ALTER TABLE guilds ADD COLUMN IF NOT EXISTS roles_hash TEXT;
+ALTER TABLE guilds ADD COLUMN IF NOT EXISTS channels_hash TEXT;
@@ -0,0 +1,39 @@
+-- Rows store the shard of their guild so shard-scoped queries can use an index
+-- This file only uses IF NOT EXISTS / OR REPLACE and can be run against existing databases
+
+-- Written by the API on startup, which re-assigns all rows when SHARD_COUNT changes
+CREATE TABLE IF NOT EXISTS shard_config (
+  id BOOL PRIMARY KEY DEFAULT TRUE CHECK (id),  -- Only allows a single row
+  shard_count INT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION shard_of(guild_id BIGINT) RETURNS INT AS $$
+  SELECT ((guild_id >> 22) % shard_count)::INT FROM shard_config
+$$ LANGUAGE SQL STABLE;
+
+CREATE OR REPLACE FUNCTION set_shard_id() RETURNS TRIGGER AS $$
+BEGIN
+  NEW.shard_id := shard_of(NEW.guild_id);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION set_guild_shard_id() RETURNS TRIGGER AS $$
+BEGIN
+  NEW.shard_id := shard_of(NEW.id);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE guilds ADD COLUMN IF NOT EXISTS shard_id INT;
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS shard_id INT;
+ALTER TABLE infractions ADD COLUMN IF NOT EXISTS shard_id INT;
+
+CREATE OR REPLACE TRIGGER guilds_shard_id BEFORE INSERT ON guilds FOR EACH ROW EXECUTE FUNCTION set_guild_shard_id();
+CREATE OR REPLACE TRIGGER reminders_shard_id BEFORE INSERT ON reminders FOR EACH ROW EXECUTE FUNCTION set_shard_id();
+CREATE OR REPLACE TRIGGER infractions_shard_id BEFORE INSERT ON infractions FOR EACH ROW EXECUTE FUNCTION set_shard_id();
+
+-- Other guild config is filtered by shard through a join on guilds
+CREATE INDEX IF NOT EXISTS guilds_shard_id_idx ON guilds (shard_id) WHERE removed_at IS NULL;
+CREATE INDEX IF NOT EXISTS reminders_shard_id_expires_at_idx ON reminders (shard_id, expires_at);
+CREATE INDEX IF NOT EXISTS infractions_shard_id_expires_at_idx ON infractions (shard_id, expires_at) WHERE expires_at IS NOT NULL;
@@ -25,9 +25,10 @@ import aredis
 import asyncpg
 from starlette.applications import Starlette
 
-from .config import PSQL_DSN, REDIS_URL
+from .config import PSQL_DSN, REDIS_URL, SHARD_COUNT
 from .middleware import register_middleware
 from .routes import router
+from .utils import assign_shards
 
 
 app = Starlette()
@@ -51,6 +52,9 @@ async def on_startup():
     app.redis = aredis.StrictRedis.from_url(str(REDIS_URL))
     app.db = await asyncpg.create_pool(str(PSQL_DSN), init=init_pg_connection)
 
+    async with app.db.acquire() as conn:
+        await assign_shards(conn, SHARD_COUNT)
+
     app.session = aiohttp.ClientSession(headers={'User-Agent': f'Mousey/4.0 (+https://github.com/LostLuma/Mousey)'})
 
 
@@ -25,6 +25,7 @@ from . import (
     archives,
     autoprune,
     autopurge,
+    batch,
     guilds,
     infractions,
     modlog,
@@ -63,6 +64,7 @@ router = Router(
                 archives,
                 autoprune,
                 autopurge,
+                batch,
                 guilds,
                 infractions,
                 modlog,
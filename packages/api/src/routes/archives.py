@@ -26,7 +26,7 @@ from starlette.routing import Router
 
 from ..auth import is_authorized
 from ..permissions import has_permissions
-from ..utils import decrypt_json, encrypt_json, generate_snowflake
+from ..utils import decrypt_json, encrypt_json, ensure_users, generate_snowflake
 
 
 router = Router()
@@ -121,14 +121,6 @@ async def post_archives_id(request):
             users.keys(),
         )
 
-        await conn.executemany(
-            """
-            INSERT INTO users (id, bot, name, discriminator, avatar)
-            VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT (id) DO UPDATE
-            SET name = EXCLUDED.name, discriminator = EXCLUDED.discriminator, avatar = EXCLUDED.avatar
-            """,
-            ((x['id'], x['bot'], x['name'], x['discriminator'], x['avatar']) for x in users.values()),
-        )
+        await ensure_users(conn, users.values())
 
     return JSONResponse({'id': archive_id})
@@ -23,7 +23,6 @@ from starlette.responses import JSONResponse
 from starlette.routing import Router
 
 from ..auth import is_authorized
-from ..config import SHARD_COUNT
 from ..permissions import has_permissions
 
 
@@ -55,10 +54,9 @@ async def get_autopurge(request):
             FROM autopurge
             JOIN channels ON autopurge.channel_id = channels.id
             JOIN guilds ON channels.guild_id = guilds.id
-            WHERE (channels.guild_id >> 22) % $2 = $1 AND guilds.removed_at IS NULL
+            WHERE guilds.shard_id = $1 AND guilds.removed_at IS NULL
             """,
             shard_id,
-            SHARD_COUNT,
         )
 
     if records:
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import json
+import urllib.parse
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.routing import Router
+
+from ..auth import is_authorized
+
+
+router = Router()
+
+
+MAX_BATCH_SIZE = 100
+BATCH_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+@router.route('/batch', methods=['POST'])
+@is_authorized
+async def post_batch(request):
+    data = await request.json()
+
+    if not isinstance(data, list) or not 0 < len(data) <= MAX_BATCH_SIZE:
+        raise HTTPException(400, f'Invalid JSON body, must be a list of 1 to {MAX_BATCH_SIZE} requests.')
+
+    try:
+        calls = [(x['method'], x['path'], x.get('params'), x.get('json')) for x in data]
+    except (KeyError, TypeError):
+        raise HTTPException(400, 'Invalid request list, missing "method" or "path" JSON field.')
+
+    if any(not isinstance(method, str) or not isinstance(path, str) for method, path, _, _ in calls):
+        raise HTTPException(400, 'Invalid request list, "method" and "path" JSON fields must be strings.')
+
+    if any(method not in BATCH_METHODS or not path.startswith('/') or path == '/batch' for method, path, _, _ in calls):
+        raise HTTPException(400, 'Invalid request list, unsupported "method" or "path" JSON field.')
+
+    results = await asyncio.gather(*(_dispatch(request, *x) for x in calls))
+    return JSONResponse(results)
+
+
+async def _dispatch(request, method, path, params, body):
+    """Runs a sub-request through the app's routes, reusing the authentication of the batch request."""
+
+    status = 500
+    chunks = []
+
+    path = '/v4' + path
+    query_string = urllib.parse.urlencode(params or {})
+
+    scope = {
+        key: value
+        for key, value in request.scope.items()
+        if key not in ('endpoint', 'path_params', 'root_path', 'router')
+    }
+
+    scope.update(
+        method=method,
+        path=path,
+        raw_path=path.encode(),
+        query_string=query_string.encode(),
+        root_path=request.scope.get('app_root_path', ''),
+    )
+
+    async def receive():
+        content = b'' if body is None else json.dumps(body).encode()
+        return {'type': 'http.request', 'body': content, 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    try:
+        await request.app.router(scope, receive, send)
+    except HTTPException as e:
+        stop = '' if e.detail.endswith('.') else '.'
+        return {'status': e.status_code, 'body': {'error': e.detail + stop}}
+    except json.JSONDecodeError:
+        return {'status': 400, 'body': {'error': 'Invalid JSON body.'}}
+    except Exception:
+        return {'status': 500, 'body': {'error': 'Internal Server Error.'}}
+
+    content = b''.join(chunks)
+
+    try:
+        return {'status': status, 'body': json.loads(content)}
+    except ValueError:
+        return {'status': status, 'body': content.decode()}
@@ -23,8 +23,8 @@ from starlette.responses import JSONResponse
 from starlette.routing import Router
 
 from ..auth import is_authorized
-from ..config import SHARD_COUNT
 from ..permissions import has_permissions
+from ..utils import to_columns
 
 
 router = Router()
@@ -42,76 +42,151 @@ async def get_guilds(request):
     async with request.app.db.acquire() as conn:
         records = await conn.fetch(
             """
-            SELECT id, name, icon
+            SELECT id, name, icon, roles_hash, channels_hash
             FROM guilds
-            WHERE (id >> 22) % $2 = $1 AND removed_at IS NULL
+            WHERE shard_id = $1 AND removed_at IS NULL
             """,
             shard_id,
-            SHARD_COUNT,
         )
 
     return JSONResponse(list(map(dict, records)))
 
 
-@router.route('/guilds/{id:int}', methods=['PUT'])
+@router.route('/guilds', methods=['PUT'])
 @is_authorized
 @has_permissions(administrator=True)
-async def put_guilds_id(request):
+async def put_guilds(request):
     data = await request.json()
-    guild_id = request.path_params['id']
 
     try:
-        name = data['name']
-        icon = data['icon']
-
-        roles = data['roles']
-        channels = data['channels']
-    except KeyError:
-        raise HTTPException(400, 'Missing "name", "icon", "roles", or "channels" JSON field.')
-
-    role_ids = [x['id'] for x in roles]
-    channel_ids = [x['id'] for x in channels]
+        guilds = {x['id']: _parse_guild(x) for x in data}
+    except (KeyError, TypeError):
+        raise HTTPException(400, 'Invalid guild list, missing "id", "name", or "icon" JSON field.')
 
     async with request.app.db.acquire() as conn:
-        exists = await conn.fetchval('SELECT true FROM guilds WHERE id = $1 AND removed_at IS NULL', guild_id)
+        async with conn.transaction():
+            created = await _sync_guilds(conn, list(guilds.values()))
 
-        await conn.execute(
-            """
-            INSERT INTO guilds (id, name, icon)
-            VALUES ($1, $2, $3)
-            ON CONFLICT (id) DO UPDATE
-            SET name = EXCLUDED.name, icon = EXCLUDED.icon, removed_at = NULL
-            """,
-            guild_id,
-            name,
-            icon,
-        )
+    return JSONResponse({'created': created})
 
-        await conn.executemany(
-            """
-            INSERT INTO roles (id, guild_id, name, position, permissions)
-            VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT (id) DO UPDATE
-            SET name = EXCLUDED.name, position = EXCLUDED.position, permissions = EXCLUDED.permissions
-            """,
-            ((x['id'], guild_id, x['name'], x['position'], x['permissions']) for x in roles),
-        )
 
-        await conn.execute('DELETE FROM roles WHERE guild_id = $1 AND NOT id = ANY($2)', guild_id, role_ids)
-
-        await conn.executemany(
-            """
-            INSERT INTO channels (id, guild_id, name, type)
-            VALUES ($1, $2, $3, $4)
-            ON CONFLICT (id) DO UPDATE
-            SET guild_id = EXCLUDED.guild_id, name = EXCLUDED.name, type = EXCLUDED.type
-            """,
-            ((x['id'], guild_id, x['name'], x['type']) for x in channels),
-        )
+@router.route('/guilds/{id:int}', methods=['PUT'])
+@is_authorized
+@has_permissions(administrator=True)
+async def put_guilds_id(request):
+    data = await request.json()
+    guild_id = request.path_params['id']
 
-        await conn.execute('DELETE FROM channels WHERE guild_id = $1 AND NOT id = ANY($2)', guild_id, channel_ids)
+    try:
+        guild = _parse_guild({**data, 'id': guild_id})
+    except KeyError:
+        raise HTTPException(400, 'Missing "name" or "icon" JSON field.')
 
-    return JSONResponse({'created': not exists})
+    async with request.app.db.acquire() as conn:
+        async with conn.transaction():
+            created = await _sync_guilds(conn, [guild])
+
+    return JSONResponse({'created': bool(created)})
+
+
+def _parse_guild(data):
+    guild = {'id': data['id'], 'name': data['name'], 'icon': data['icon']}
+
+    # Roles and channels are only sent when their content hash changed
+    for name in ('roles', 'channels'):
+        if data.get(name) is not None:
+            guild[name] = data[name]
+            guild[f'{name}_hash'] = data.get(f'{name}_hash')
+
+    return guild
+
+
+async def _sync_guilds(conn, guilds):
+    """Upserts guilds and any role or channel sections sent, returns the IDs of newly added guilds."""
+
+    guild_ids = [x['id'] for x in guilds]
+    records = await conn.fetch('SELECT id FROM guilds WHERE id = ANY($1) AND removed_at IS NULL', guild_ids)
+
+    await conn.execute(
+        """
+        INSERT INTO guilds (id, name, icon)
+        SELECT * FROM unnest($1::bigint[], $2::text[], $3::text[])
+        ON CONFLICT (id) DO UPDATE
+        SET name = EXCLUDED.name, icon = EXCLUDED.icon, removed_at = NULL
+        """,
+        *to_columns(((x['id'], x['name'], x['icon']) for x in guilds), 3),
+    )
+
+    with_roles = [x for x in guilds if 'roles' in x]
+    with_channels = [x for x in guilds if 'channels' in x]
+
+    if with_roles:
+        await _sync_roles(conn, with_roles)
+
+    if with_channels:
+        await _sync_channels(conn, with_channels)
+
+    existing = {x['id'] for x in records}
+    return [x for x in guild_ids if x not in existing]
+
+
+async def _sync_roles(conn, guilds):
+    rows = [(x['id'], g['id'], x['name'], x['position'], x['permissions']) for g in guilds for x in g['roles']]
+
+    await conn.execute(
+        """
+        INSERT INTO roles (id, guild_id, name, position, permissions)
+        SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[], $4::int[], $5::bigint[])
+        ON CONFLICT (id) DO UPDATE
+        SET name = EXCLUDED.name, position = EXCLUDED.position, permissions = EXCLUDED.permissions
+        """,
+        *to_columns(rows, 5),
+    )
+
+    # Role IDs are unique across guilds, so one statement can prune every guild
+    await conn.execute(
+        'DELETE FROM roles WHERE guild_id = ANY($1) AND NOT id = ANY($2)',
+        [x['id'] for x in guilds],
+        [x[0] for x in rows],
+    )
+
+    await conn.execute(
+        """
+        UPDATE guilds SET roles_hash = x.hash
+        FROM unnest($1::bigint[], $2::text[]) AS x (id, hash)
+        WHERE guilds.id = x.id
+        """,
+        *to_columns(((x['id'], x['roles_hash']) for x in guilds), 2),
+    )
+
+
+async def _sync_channels(conn, guilds):
+    rows = [(x['id'], g['id'], x['name'], x['type']) for g in guilds for x in g['channels']]
+
+    await conn.execute(
+        """
+        INSERT INTO channels (id, guild_id, name, type)
+        SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[], $4::int[])
+        ON CONFLICT (id) DO UPDATE
+        SET guild_id = EXCLUDED.guild_id, name = EXCLUDED.name, type = EXCLUDED.type
+        """,
+        *to_columns(rows, 4),
+    )
+
+    await conn.execute(
+        'DELETE FROM channels WHERE guild_id = ANY($1) AND NOT id = ANY($2)',
+        [x['id'] for x in guilds],
+        [x[0] for x in rows],
+    )
+
+    await conn.execute(
+        """
+        UPDATE guilds SET channels_hash = x.hash
+        FROM unnest($1::bigint[], $2::text[]) AS x (id, hash)
+        WHERE guilds.id = x.id
+        """,
+        *to_columns(((x['id'], x['channels_hash']) for x in guilds), 2),
+    )
 
 
 @router.route('/guilds/{guild_id:int}/roles/{id:int}', methods=['PUT'])
@@ -146,6 +221,9 @@ async def put_guilds_guild_id_roles_id(request):
             permissions,
         )
 
+        # Role set no longer matches the synced hash
+        await conn.execute('UPDATE guilds SET roles_hash = NULL WHERE id = $1', guild_id)
+
     return JSONResponse({})
 
 
@@ -154,9 +232,11 @@ async def put_guilds_guild_id_roles_id(request):
 @has_permissions(administrator=True)
 async def delete_guilds_guild_id_roles_id(request):
     role_id = request.path_params['id']
+    guild_id = request.path_params['guild_id']
 
     async with request.app.db.acquire() as conn:
         status = await conn.execute('DELETE FROM roles WHERE id = $1', role_id)
+        await conn.execute('UPDATE guilds SET roles_hash = NULL WHERE id = $1', guild_id)
 
     if int(status.split()[1]):
         return JSONResponse({})
@@ -195,6 +275,8 @@ async def put_guilds_guild_id_channels_id(request):
             channel_type,
         )
 
+        await conn.execute('UPDATE guilds SET channels_hash = NULL WHERE id = $1', guild_id)
+
     return JSONResponse({})
 
 
@@ -203,9 +285,11 @@ async def put_guilds_guild_id_channels_id(request):
 @has_permissions(administrator=True)
 async def delete_guilds_guild_id_channels_id(request):
     channel_id = request.path_params['id']
+    guild_id = request.path_params['guild_id']
 
     async with request.app.db.acquire() as conn:
         status = await conn.execute('DELETE FROM channels WHERE id = $1', channel_id)
+        await conn.execute('UPDATE guilds SET channels_hash = NULL WHERE id = $1', guild_id)
 
     if int(status.split()[1]):
         return JSONResponse({})
@@ -213,6 +297,25 @@ async def delete_guilds_guild_id_channels_id(request):
     raise HTTPException(404, 'Channel not found.')
 
 
+@router.route('/guilds/removed', methods=['POST'])
+@is_authorized
+@has_permissions(administrator=True)
+async def post_guilds_removed(request):
+    data = await request.json()
+
+    try:
+        guild_ids = [int(x) for x in data['guild_ids']]
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(400, 'Invalid or missing "guild_ids" JSON field.')
+
+    async with request.app.db.acquire() as conn:
+        records = await conn.fetch(
+            'UPDATE guilds SET removed_at = NOW() WHERE id = ANY($1) AND removed_at IS NULL RETURNING id', guild_ids
+        )
+
+    return JSONResponse({'removed': [x['id'] for x in records]})
+
+
 @router.route('/guilds/{id:int}', methods=['DELETE'])
 @is_authorized
 @has_permissions(administrator=True)
@@ -24,7 +24,6 @@ from starlette.responses import JSONResponse
 from starlette.routing import Router
 
 from ..auth import is_authorized
-from ..config import SHARD_COUNT
 from ..permissions import has_permissions
 from ..utils import build_update_query, ensure_user, parse_expires_at
 
@@ -57,12 +56,11 @@ async def get_infractions(request):
             """
             SELECT id, guild_id, action, user_id, actor_id, reason, created_at, expires_at
             FROM infractions
-            WHERE (guild_id >> 22) % $2 = $1 AND expires_at IS NOT NULL
+            WHERE shard_id = $1 AND expires_at IS NOT NULL
             ORDER BY expires_at ASC
             LIMIT 1
             """,
             shard_id,
-            SHARD_COUNT,
         )
 
     if records:
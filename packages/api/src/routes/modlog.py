@@ -24,6 +24,7 @@ from starlette.routing import Router
 
 from ..auth import is_authorized
 from ..permissions import has_permissions
+from ..utils import publish_invalidation
 
 
 router = Router()
@@ -58,6 +59,7 @@ async def get_guilds_guild_id_modlogs(request):
 async def put_guilds_guild_id_modlogs_id(request):
     data = await request.json()
     channel_id = request.path_params['id']
+    guild_id = request.path_params['guild_id']
 
     try:
         events = data['events']
@@ -76,6 +78,7 @@ async def put_guilds_guild_id_modlogs_id(request):
             events,
         )
 
+    await publish_invalidation(request.app.redis, 'modlogs', guild_id)
     return JSONResponse({})
 
 
@@ -84,11 +87,13 @@ async def put_guilds_guild_id_modlogs_id(request):
 @has_permissions(administrator=True)
 async def delete_guilds_guild_id_modlogs_id(request):
     channel_id = request.path_params['id']
+    guild_id = request.path_params['guild_id']
 
     async with request.app.db.acquire() as conn:
         status = await conn.execute('DELETE FROM modlogs WHERE channel_id = $1', channel_id)
 
     if int(status.split()[1]):
+        await publish_invalidation(request.app.redis, 'modlogs', guild_id)
         return JSONResponse({})
 
     raise HTTPException(404, 'Modlog channel not found.')
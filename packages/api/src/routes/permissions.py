@@ -24,11 +24,38 @@ from starlette.routing import Router
 
 from ..auth import is_authorized
 from ..permissions import has_permissions
+from ..utils import publish_invalidation
 
 
 router = Router()
 
 
+@router.route('/permissions', methods=['GET'])
+@is_authorized
+@has_permissions(administrator=True)
+async def get_permissions(request):
+    try:
+        shard_id = int(request.query_params['shard_id'])
+    except (KeyError, ValueError):
+        raise HTTPException(400, 'Invalid or missing "shard_id" query param.')
+
+    async with request.app.db.acquire() as conn:
+        records = await conn.fetch(
+            """
+            SELECT required_roles.guild_id, required_roles.required_roles
+            FROM required_roles
+            JOIN guilds ON required_roles.guild_id = guilds.id
+            WHERE guilds.shard_id = $1 AND guilds.removed_at IS NULL
+            """,
+            shard_id,
+        )
+
+    if records:
+        return JSONResponse(list(map(dict, records)))
+
+    raise HTTPException(404, 'No permissions found.')
+
+
 @router.route('/guilds/{id:int}/permissions', methods=['GET'])
 @is_authorized
 @has_permissions(administrator=True)
@@ -68,4 +95,5 @@ async def put_guilds_id_prefixes(request):
             required_roles,
         )
 
+    await publish_invalidation(request.app.redis, 'permissions', guild_id)
     return JSONResponse({})
@@ -24,11 +24,38 @@ from starlette.routing import Router
 
 from ..auth import is_authorized
 from ..permissions import has_permissions
+from ..utils import publish_invalidation
 
 
 router = Router()
 
 
+@router.route('/prefixes', methods=['GET'])
+@is_authorized
+@has_permissions(administrator=True)
+async def get_prefixes(request):
+    try:
+        shard_id = int(request.query_params['shard_id'])
+    except (KeyError, ValueError):
+        raise HTTPException(400, 'Invalid or missing "shard_id" query param.')
+
+    async with request.app.db.acquire() as conn:
+        records = await conn.fetch(
+            """
+            SELECT prefixes.guild_id, prefixes.prefixes
+            FROM prefixes
+            JOIN guilds ON prefixes.guild_id = guilds.id
+            WHERE guilds.shard_id = $1 AND guilds.removed_at IS NULL AND cardinality(prefixes.prefixes) > 0
+            """,
+            shard_id,
+        )
+
+    if records:
+        return JSONResponse(list(map(dict, records)))
+
+    raise HTTPException(404, 'No custom prefixes found.')
+
+
 @router.route('/guilds/{id:int}/prefixes', methods=['GET'])
 @is_authorized
 @has_permissions(administrator=True)
@@ -65,4 +92,5 @@ async def put_guilds_id_prefixes(request):
             prefixes,
         )
 
+    await publish_invalidation(request.app.redis, 'prefixes', guild_id)
     return JSONResponse({})
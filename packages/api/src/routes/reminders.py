@@ -18,12 +18,13 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import datetime
+
 from starlette.exceptions import HTTPException
 from starlette.responses import JSONResponse
 from starlette.routing import Router
 
 from ..auth import is_authorized
-from ..config import SHARD_COUNT
 from ..permissions import has_permissions
 from ..utils import build_update_query, ensure_user, parse_expires_at
 
@@ -48,18 +49,31 @@ async def get_reminders(request):
     except (KeyError, ValueError):
         raise HTTPException(400, 'Invalid or missing "shard_id" or "limit" query param.')
 
+    before = request.query_params.get('before')
+
+    if before is None:
+        before = datetime.datetime.max  # Sent to Postgres as infinity
+    else:
+        try:
+            before = datetime.datetime.fromisoformat(before)
+        except ValueError:
+            raise HTTPException(400, 'Invalid "before" query param.')
+
+        # Every reminder due inside the window is returned at once
+        limit = None
+
     async with request.app.db.acquire() as conn:
         records = await conn.fetch(
             """
             SELECT id, user_id, guild_id, channel_id, thread_id, message_id, referenced_message_id, expires_at, message
             FROM reminders
-            WHERE (guild_id >> 22) % $2 = $1
+            WHERE shard_id = $1 AND expires_at < $3
             ORDER BY expires_at ASC
-            LIMIT $3
+            LIMIT $2
             """,
             shard_id,
-            SHARD_COUNT,
             limit,
+            before,
         )
 
     if records:
@@ -202,6 +216,23 @@ async def delete_reminders_id(request):
     raise HTTPException(404, 'Reminder not found.')
 
 
+@router.route('/reminders/deleted', methods=['POST'])
+@is_authorized
+@has_permissions(administrator=True)
+async def post_reminders_deleted(request):
+    data = await request.json()
+
+    try:
+        reminder_ids = [int(x) for x in data['reminder_ids']]
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(400, 'Invalid or missing "reminder_ids" JSON field.')
+
+    async with request.app.db.acquire() as conn:
+        records = await conn.fetch('DELETE FROM reminders WHERE id = ANY($1) RETURNING id', reminder_ids)
+
+    return JSONResponse({'deleted': [x['id'] for x in records]})
+
+
 @router.route('/guilds/{guild_id:int}/members/{member_id:int}/reminders', methods=['GET'])
 @is_authorized
 @has_permissions(administrator=True)
@@ -25,6 +25,7 @@ from starlette.routing import Router
 
 from ..auth import is_authorized
 from ..permissions import has_permissions
+from ..utils import publish_invalidation
 
 
 router = Router()
@@ -82,7 +83,9 @@ async def get_guilds_guild_id_groups(request):
 @has_permissions(administrator=True)
 async def put_guilds_guild_id_groups_id(request):
     data = await request.json()
+
     role_id = request.path_params['id']
+    guild_id = request.path_params['guild_id']
 
     try:
         description = data['description']
@@ -107,6 +110,7 @@ async def put_guilds_guild_id_groups_id(request):
             description,
         )
 
+    await publish_invalidation(request.app.redis, 'groups', guild_id)
     return JSONResponse({})
 
 
@@ -115,11 +119,13 @@ async def put_guilds_guild_id_groups_id(request):
 @has_permissions(administrator=True)
 async def delete_guilds_guild_id_groups_id(request):
     role_id = request.path_params['id']
+    guild_id = request.path_params['guild_id']
 
     async with request.app.db.acquire() as conn:
         status = await conn.execute('DELETE FROM groups WHERE role_id = $1', role_id)
 
     if int(status.split()[1]):
+        await publish_invalidation(request.app.redis, 'groups', guild_id)
         return JSONResponse({})
 
     raise HTTPException(404, 'Group not found.')
@@ -29,6 +29,33 @@ from ..permissions import has_permissions
 router = Router()
 
 
+@router.route('/templates', methods=['GET'])
+@is_authorized
+@has_permissions(administrator=True)
+async def get_templates(request):
+    try:
+        shard_id = int(request.query_params['shard_id'])
+    except (KeyError, ValueError):
+        raise HTTPException(400, 'Invalid or missing "shard_id" query param.')
+
+    async with request.app.db.acquire() as conn:
+        records = await conn.fetch(
+            """
+            SELECT channels.guild_id, templates.channel_id, templates.data
+            FROM templates
+            JOIN channels ON templates.channel_id = channels.id
+            JOIN guilds ON channels.guild_id = guilds.id
+            WHERE guilds.shard_id = $1 AND guilds.removed_at IS NULL
+            """,
+            shard_id,
+        )
+
+    if records:
+        return JSONResponse(list(map(dict, records)))
+
+    raise HTTPException(404, 'No channel templates found.')
+
+
 @router.route('/guilds/{id:int}/templates', methods=['GET'])
 @is_authorized
 @has_permissions(administrator=True)
@@ -24,11 +24,37 @@ from starlette.routing import Router
 
 from ..auth import is_authorized
 from ..permissions import has_permissions
+from ..utils import to_columns
 
 
 router = Router()
 
 
+@router.route('/users', methods=['PATCH'])
+@is_authorized
+@has_permissions(edit_users=True)
+async def patch_users(request):
+    data = await request.json()
+
+    try:
+        users = {x['id']: (x['id'], x['name'], x['discriminator'], x['avatar']) for x in data}
+    except (KeyError, TypeError):
+        raise HTTPException(400, 'Invalid user list, missing "id", "name", "discriminator", or "avatar" JSON field.')
+
+    # Like PATCH /users/{id} this only updates users which are already known
+    async with request.app.db.acquire() as conn:
+        status = await conn.execute(
+            """
+            UPDATE users SET name = x.name, discriminator = x.discriminator, avatar = x.avatar
+            FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[]) AS x (id, name, discriminator, avatar)
+            WHERE users.id = x.id
+            """,
+            *to_columns(users.values(), 4),
+        )
+
+    return JSONResponse({'updated': int(status.split()[1])})
+
+
 @router.route('/users/{id:int}', methods=['PATCH'])
 @is_authorized
 @has_permissions(edit_users=True)
@@ -19,6 +19,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 from .crypto import decrypt_json, encrypt_json
-from .helpers import ensure_user, find_request_parameter, parse_expires_at
+from .helpers import ensure_user, ensure_users, find_request_parameter, parse_expires_at, publish_invalidation
+from .shards import assign_shards
 from .snowflake import generate_snowflake
-from .sql import build_update_query
+from .sql import build_update_query, to_columns
@@ -20,9 +20,15 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import datetime
 import inspect
+import json
 
 from starlette.exceptions import HTTPException
 
+from .sql import to_columns
+
+
+# The bot evicts cached configuration when a message is published here
+INVALIDATION_CHANNEL = 'mousey:invalidate'
 
 # Code taken from Starlette's @requires decorator
 def find_request_parameter(func):
@@ -51,6 +57,23 @@ async def ensure_user(connection, user):
     )
 
 
+async def ensure_users(connection, users):
+    await connection.execute(
+        """
+        INSERT INTO users (id, bot, name, discriminator, avatar)
+        SELECT * FROM unnest($1::bigint[], $2::bool[], $3::text[], $4::text[], $5::text[])
+        ON CONFLICT (id) DO UPDATE
+        SET name = EXCLUDED.name, discriminator = EXCLUDED.discriminator, avatar = EXCLUDED.avatar
+        """,
+        *to_columns(((x['id'], x['bot'], x['name'], x['discriminator'], x['avatar']) for x in users), 5),
+    )
+
+
+async def publish_invalidation(redis, kind, guild_id):
+    data = {'kind': kind, 'guild_id': guild_id}
+    await redis.publish(INVALIDATION_CHANNEL, json.dumps(data))
+
+
 def parse_expires_at(value):
     if value is None:
         return
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Tables with a shard_id column, and the column holding their guild ID
+SHARDED_TABLES = {
+    'guilds': 'id',
+    'reminders': 'guild_id',
+    'infractions': 'guild_id',
+}
+
+
+async def assign_shards(connection, shard_count):
+    """Stores the current shard count, re-assigning every row to its new shard if it changed."""
+
+    async with connection.transaction():
+        # Inserts compute their shard using this table, so they wait until rows have been re-assigned
+        await connection.execute('LOCK TABLE shard_config IN ACCESS EXCLUSIVE MODE')
+
+        if await connection.fetchval('SELECT shard_count FROM shard_config') == shard_count:
+            return
+
+        await connection.execute(
+            """
+            INSERT INTO shard_config (shard_count)
+            VALUES ($1)
+            ON CONFLICT (id) DO UPDATE
+            SET shard_count = EXCLUDED.shard_count
+            """,
+            shard_count,
+        )
+
+        for table, column in SHARDED_TABLES.items():
+            await connection.execute(f'UPDATE {table} SET shard_id = shard_of({column})')
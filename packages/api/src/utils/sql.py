@@ -30,3 +30,10 @@ def build_update_query(parameters):
         idx += 1
 
     return ', '.join(updates), idx
+
+
+def to_columns(rows, width):
+    """Turns a list of rows into one list per column, to be passed to unnest() as arrays."""
+
+    columns = [list(x) for x in zip(*rows)]
+    return columns or [[] for _ in range(width)]
@@ -19,8 +19,27 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import bisect
+import collections
+import copy
+import functools
+import re
+import time
 
 from .config import API_TOKEN, API_URL
+from .utils import create_task
+
+
+# Calls made within this many seconds are sent together when batching is enabled
+BATCH_WINDOW = 0.005
+MAX_BATCH_SIZE = 100
+
+CACHE_SIZE = 10_000
+# Config changes are announced by the API, this only limits how long a missed announcement matters
+CONFIG_CACHE_TTL = 60 * 60
+
+# Upper bounds in seconds, the last bucket counts everything slower
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 
 
 class HTTPException(Exception):
@@ -37,11 +56,224 @@ class NotFound(HTTPException):
         super().__init__(404, message)
 
 
+class LatencyHistogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def __repr__(self):
+        return f'<LatencyHistogram count={self.count} p50={self.percentile(50)} p99={self.percentile(99)}>'
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+
+    def percentile(self, percentile):
+        """Returns the upper bound of the bucket the percentile falls into."""
+
+        if not self.count:
+            return 0
+
+        seen = 0
+        required = self.count * percentile / 100
+
+        for idx, count in enumerate(self.buckets):
+            seen += count
+
+            if seen >= required:
+                break
+
+        return LATENCY_BUCKETS[idx] if idx < len(LATENCY_BUCKETS) else float('inf')
+
+
+class ResponseCache:
+    """LRU cache of GET responses by path, every entry expires after its own TTL."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+
+    def get(self, path):
+        try:
+            expires_at, result = self._entries[path]
+        except KeyError:
+            return None
+
+        if expires_at <= time.monotonic():
+            del self._entries[path]
+            return None
+
+        self._entries.move_to_end(path)
+        return result
+
+    def set(self, path, result, ttl):
+        self._entries[path] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(path)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, path):
+        self._entries.pop(path, None)
+
+
+def endpoint_name(method, path):
+    # Eg. GET /guilds/{id}/prefixes
+    return method + ' ' + re.sub(r'/\d+', '/{id}', path)
+
+
 class APIClient:
-    def __init__(self, session):
+    def __init__(self, session, *, batching=False):
         self.session = session
+        self.batching = batching
+
+        self._batch = []
+        self._batch_handle = None
+
+        # Identical GETs share one request while it is in flight
+        self._inflight = {}
+        self._cache = ResponseCache(CACHE_SIZE)
+
+        self.latencies = collections.defaultdict(LatencyHistogram)
+
+    def invalidate(self, path):
+        """Drops the cached response for a path and discards any request for it which is in flight."""
+
+        self._cache.pop(path)
+
+        for key in [x for x in self._inflight if x[0] == path]:
+            del self._inflight[key]
+
+    async def request(self, method, path, *, cache_ttl=None, **kwargs):
+        if method != 'GET':
+            try:
+                return await self._timed_request(method, path, **kwargs)
+            finally:
+                # Writes invalidate the resource and the collection it is part of
+                self.invalidate(path)
+                self.invalidate(path.rsplit('/', 1)[0])
+
+        # Only responses of requests without query params are cached
+        if 'params' in kwargs:
+            cache_ttl = None
+
+        if cache_ttl is not None:
+            result = self._cache.get(path)
 
-    async def request(self, method, path, **kwargs):
+            if isinstance(result, NotFound):
+                raise NotFound(result.message)
+
+            if result is not None:
+                return copy.deepcopy(result)
+
+        key = (path, tuple(sorted(kwargs.get('params', {}).items())))
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(self._timed_request(method, path, **kwargs))
+            task.add_done_callback(functools.partial(self._request_done, key, cache_ttl))
+
+            self._inflight[key] = task
+
+        # Responses are shared between callers and the cache, every caller gets its own copy
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _request_done(self, key, cache_ttl, task):
+        if self._inflight.get(key) is not task:
+            return  # Invalidated while in flight
+
+        del self._inflight[key]
+
+        if cache_ttl is None or task.cancelled():
+            return
+
+        exc = task.exception()
+
+        if exc is None:
+            self._cache.set(key[0], task.result(), cache_ttl)
+        elif isinstance(exc, NotFound):
+            self._cache.set(key[0], exc, cache_ttl)
+
+    async def _timed_request(self, method, path, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            if self.batching:
+                return await self._batched_request(method, path, **kwargs)
+
+            return await self._request(method, path, **kwargs)
+        finally:
+            self.latencies[endpoint_name(method, path)].observe(time.perf_counter() - start)
+
+    async def _batched_request(self, method, path, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((method, path, kwargs, future))
+
+        if len(self._batch) >= MAX_BATCH_SIZE:
+            self._flush_batch()
+        elif self._batch_handle is None:
+            self._batch_handle = asyncio.get_running_loop().call_later(BATCH_WINDOW, self._flush_batch)
+
+        return await future
+
+    def _flush_batch(self):
+        if self._batch_handle is not None:
+            self._batch_handle.cancel()
+            self._batch_handle = None
+
+        batch, self._batch = self._batch, []
+        create_task(self._send_batch(batch))
+
+    async def _send_batch(self, batch):
+        if len(batch) == 1:
+            await self._resolve_directly(*batch[0])
+            return
+
+        calls = [{'method': method, 'path': path, **kwargs} for method, path, kwargs, _ in batch]
+
+        try:
+            results = await self._request('POST', '/batch', json=calls)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+            return
+
+        for (method, path, kwargs, future), result in zip(batch, results):
+            status = result['status']
+            body = result['body']
+
+            if 500 <= status <= 599:
+                # Retried on its own the same way as any other request
+                create_task(self._resolve_directly(method, path, kwargs, future))
+            elif future.done():
+                continue  # Caller is no longer waiting
+            elif 200 <= status <= 299:
+                future.set_result(body)
+            else:
+                error = body['error'] if isinstance(body, dict) else body
+                future.set_exception(NotFound(error) if status == 404 else HTTPException(status, error))
+
+    async def _resolve_directly(self, method, path, kwargs, future):
+        try:
+            result = await self._request(method, path, **kwargs)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def _request(self, method, path, **kwargs):
         kwargs.setdefault('headers', {})
         kwargs['headers']['Authorization'] = API_TOKEN
 
@@ -105,6 +337,9 @@ class APIClient:
         guild_id = data['id']
         return await self.request('PUT', f'/guilds/{guild_id}', json=data)
 
+    async def create_guilds(self, guilds):
+        return await self.request('PUT', '/guilds', json=guilds)
+
     async def create_role(self, guild_id, data):
         role_id = data['id']
         return await self.request('PUT', f'/guilds/{guild_id}/roles/{role_id}', json=data)
@@ -122,10 +357,14 @@ class APIClient:
     async def delete_guild(self, guild_id):
         return await self.request('DELETE', f'/guilds/{guild_id}')
 
+    async def delete_guilds(self, guild_ids):
+        data = {'guild_ids': guild_ids}
+        return await self.request('POST', '/guilds/removed', json=data)
+
     # Modlog
 
     async def get_guild_modlogs(self, guild_id):
-        return await self.request('GET', f'/guilds/{guild_id}/modlogs')
+        return await self.request('GET', f'/guilds/{guild_id}/modlogs', cache_ttl=CONFIG_CACHE_TTL)
 
     async def set_channel_modlogs(self, guild_id, channel_id, events):
         data = {'events': events}
@@ -136,24 +375,36 @@ class APIClient:
 
     # Permissions
 
+    async def get_shard_permissions(self, shard_id):
+        params = {'shard_id': shard_id}
+        return await self.request('GET', '/permissions', params=params)
+
     async def get_permissions(self, guild_id):
-        return await self.request('GET', f'/guilds/{guild_id}/permissions')
+        return await self.request('GET', f'/guilds/{guild_id}/permissions', cache_ttl=CONFIG_CACHE_TTL)
 
     async def set_permissions(self, guild_id, data):
         return await self.request('PUT', f'/guilds/{guild_id}/permissions', json=data)
 
     # Prefixes
 
+    async def get_shard_prefixes(self, shard_id):
+        params = {'shard_id': shard_id}
+        return await self.request('GET', '/prefixes', params=params)
+
     async def get_prefixes(self, guild_id):
-        return await self.request('GET', f'/guilds/{guild_id}/prefixes')
+        return await self.request('GET', f'/guilds/{guild_id}/prefixes', cache_ttl=CONFIG_CACHE_TTL)
 
     async def set_prefixes(self, guild_id, prefixes):
         return await self.request('PUT', f'/guilds/{guild_id}/prefixes', json=prefixes)
 
     # Reminders
 
-    async def get_reminders(self, shard_id, limit=1):
+    async def get_reminders(self, shard_id, limit=1, before=None):
         params = {'shard_id': shard_id, 'limit': limit}
+
+        if before is not None:
+            params['before'] = before.isoformat()
+
         return await self.request('GET', '/reminders', params=params)
 
     async def get_reminder(self, reminder_id):
@@ -168,13 +419,17 @@ class APIClient:
     async def delete_reminder(self, reminder_id):
         return await self.request('DELETE', f'/reminders/{reminder_id}')
 
+    async def delete_reminders(self, reminder_ids):
+        data = {'reminder_ids': reminder_ids}
+        return await self.request('POST', '/reminders/deleted', json=data)
+
     async def get_member_reminders(self, guild_id, member_id):
         return await self.request('GET', f'/guilds/{guild_id}/members/{member_id}/reminders')
 
     # Roles
 
     async def get_groups(self, guild_id):
-        return await self.request('GET', f'/guilds/{guild_id}/groups')
+        return await self.request('GET', f'/guilds/{guild_id}/groups', cache_ttl=CONFIG_CACHE_TTL)
 
     async def create_group(self, guild_id, role_id, data):
         return await self.request('PUT', f'/guilds/{guild_id}/groups/{role_id}', json=data)
@@ -193,11 +448,18 @@ class APIClient:
 
     # Templates
 
+    async def get_shard_templates(self, shard_id):
+        params = {'shard_id': shard_id}
+        return await self.request('GET', '/templates', params=params)
+
     async def get_templates(self, guild_id):
         return await self.request('GET', f'/guilds/{guild_id}/templates')
 
     # Users
 
+    async def update_users(self, users):
+        return await self.request('PATCH', '/users', json=users)
+
     async def update_user(self, data):
         user_id = data['id']
         return await self.request('PATCH', f'/users/{user_id}', json=data)
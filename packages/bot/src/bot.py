@@ -30,7 +30,7 @@ from discord.ext import commands
 
 from . import __version__
 from .api import APIClient
-from .config import BOT_TOKEN, PSQL_URL, REDIS_URL, SHARD_COUNT
+from .config import API_BATCHING, BOT_TOKEN, PSQL_URL, REDIS_URL, SHARD_COUNT
 from .context import Context
 from .utils import create_task
 
@@ -52,7 +52,8 @@ async def get_prefix(mousey, message):
     if config is None:
         return base  # Always return valid prefixes
 
-    return base + await config.get_prefixes(message.guild)
+    # Only return the matched prefix so discord.py does not try every prefix again
+    return await config.match_prefix(message) or base
 
 
 class Mousey(commands.Bot):
@@ -109,7 +110,7 @@ class Mousey(commands.Bot):
             headers={'User-Agent': f'Mousey/{__version__} (+https://github.com/LostLuma/Mousey)'}
         )
 
-        self.api = APIClient(self.session)
+        self.api = APIClient(self.session, batching=API_BATCHING)
 
         plugins = ['jishaku']
         base = pathlib.Path('./src/plugins')
@@ -139,6 +140,12 @@ class Mousey(commands.Bot):
         if message.author.bot:
             return
 
+        config = self.get_cog('Config')
+
+        # Skip regular chatter before creating a Context
+        if config is not None and await config.match_prefix(message) is None:
+            return
+
         ctx = await self.get_context(message, cls=Context)
         await self.invoke(ctx)
 
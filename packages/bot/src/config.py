@@ -38,3 +38,10 @@ SHARD_COUNT = int(os.environ['SHARD_COUNT'])
 
 # Optional blobs.gg API key
 BLOBS_GG_TOKEN = os.environ.get('BLOBS_GG_TOKEN')
+
+# Optionally combine API calls made at the same time into batch requests
+API_BATCHING = os.environ.get('API_BATCHING') == 'true'
+
+# Optional durable modlog delivery using Redis Streams
+MODLOG_STREAMS = os.environ.get('MODLOG_STREAMS') == 'true'
+MODLOG_PARTITIONS = int(os.environ.get('MODLOG_PARTITIONS', 64))
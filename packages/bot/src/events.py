@@ -36,12 +36,19 @@ class _AttributedEvent:
             return cls(*args, moderator=entry.user, reason=entry.reason)
 
 
+# mouse_config_reset
+# Dispatched without an event, the config of every guild may have changed
+
+
 # mouse_config_update
 class ConfigUpdateEvent:
-    __slots__ = ('guild',)
+    __slots__ = ('guild', 'kind')
 
-    def __init__(self, guild):
+    # The kind is one of groups, modlogs, permissions, or prefixes
+    # When it is None any part of the guild's config may have changed
+    def __init__(self, guild, kind=None):
         self.guild = guild
+        self.kind = kind
 
     @property
     def key(self):
@@ -24,7 +24,7 @@ import datetime
 import discord
 from discord.ext import commands
 
-from ... import InfractionEvent, Plugin, bot_has_permissions, group
+from ... import Plugin, bot_has_permissions, group
 from ...utils import create_task
 from .converter import PruneDays
 from .enums import PruneStrategy
@@ -108,6 +108,12 @@ class Admin(Plugin):
         await self._prune_command(ctx, PruneStrategy.seen, roles, days)
 
     async def _prune_command(self, ctx, strategy, roles, days):
+        executor = self.mousey.get_cog('AutoPrune').executor
+
+        if executor.get_job(ctx.guild) is not None:
+            await ctx.send('A prune is already running in this server, please wait for it to finish.')
+            return
+
         if not roles:
             members = ctx.guild.members
         else:
@@ -165,22 +171,19 @@ class Admin(Plugin):
             await ctx.send('Successfully cancelled prune.')
             return
 
-        me = ctx.guild.me
-        guild = ctx.guild
+        if executor.get_job(ctx.guild) is not None:
+            await ctx.send('A prune was started in this server in the meantime, please wait for it to finish.')
+            return
 
-        events = self.mousey.get_cog('Events')
         reason = f'Prune initiated by {ctx.author}'
+        members = [member for member, status in zip(members, statuses) if check(status)]
 
-        for member, status in zip(members, statuses):
-            if check(status):
-                event = InfractionEvent(guild, member, me, reason)
-                events.ignore(guild, 'mouse_member_kick', event)
+        job = await executor.start(ctx.guild, members, reason)
+        await ctx.send(f'Pruning `{count}` members, this may take a while.')
 
-                try:
-                    await member.kick(reason=reason)
-                except discord.HTTPException:
-                    pass
-                else:
-                    self.mousey.dispatch('mouse_member_kick', event)
+        await job.wait()
 
-        await ctx.send(f'Successfully pruned `{count}` members.')
+        if job.completed < job.total:
+            await ctx.send(f'Prune was interrupted after removing `{job.kicked}` members, it will continue later.')
+        else:
+            await ctx.send(f'Successfully pruned `{job.kicked}` members.')
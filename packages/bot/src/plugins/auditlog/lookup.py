@@ -19,6 +19,8 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import heapq
+import itertools
 import time
 from typing import Callable, Optional, Union
 
@@ -26,6 +28,7 @@ import discord
 
 
 CheckFunction = Callable[[discord.AuditLogEntry], bool]
+LookupKey = tuple[discord.AuditLogAction, Optional[int]]
 
 
 def _default_check(entry: discord.AuditLogEntry) -> bool:
@@ -35,7 +38,7 @@ def _default_check(entry: discord.AuditLogEntry) -> bool:
 class Lookup:
     """Represents an unfulfilled audit log lookup."""
 
-    __slots__ = ('_future', 'action', 'check', 'expires_at', 'target')
+    __slots__ = ('_future', 'action', 'check', 'created_at', 'expires_at', 'target')
 
     def __init__(
         self,
@@ -48,10 +51,15 @@ class Lookup:
         self.check: CheckFunction = check or _default_check
         self.target: Optional[discord.abc.Snowflake] = target
 
-        self.expires_at: float = time.monotonic() + timeout
+        self.created_at: float = time.monotonic()
+        self.expires_at: float = self.created_at + timeout
 
         self._future: asyncio.Future[Union[discord.AuditLogEntry, None]] = asyncio.get_event_loop().create_future()
 
+    @property
+    def key(self) -> LookupKey:
+        return self.action, self.target and self.target.id
+
     def is_expired(self) -> bool:
         return time.monotonic() > self.expires_at
 
@@ -64,6 +72,9 @@ class Lookup:
 
         return self.check(entry)
 
+    def done(self) -> bool:
+        return self._future.done()
+
     def wait(self) -> asyncio.Future[Union[discord.AuditLogEntry, None]]:
         return self._future
 
@@ -72,3 +83,91 @@ class Lookup:
             self._future.set_result(result)
         except asyncio.InvalidStateError:
             pass  # Lookup has been cancelled
+
+
+class PendingLookups:
+    """
+    Unfulfilled Lookups of a guild, indexed by action and target ID.
+
+    Lookups without a target are stored with a target ID of None and checked against every entry of their action.
+    Expiry is tracked using a heap, resolved Lookups are removed from it lazily once their expiry time has passed.
+    """
+
+    __slots__ = ('_buckets', '_expiry', '_counter')
+
+    def __init__(self) -> None:
+        # Dicts are used as ordered sets to match Lookups in the order they were added
+        self._buckets: dict[LookupKey, dict[Lookup, None]] = {}
+
+        self._counter = itertools.count()
+        self._expiry: list[tuple[float, int, Lookup]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self._buckets)
+
+    def __len__(self) -> int:
+        return sum(map(len, self._buckets.values()))
+
+    @property
+    def actions(self) -> set[discord.AuditLogAction]:
+        return {action for action, _ in self._buckets}
+
+    def add(self, lookup: Lookup) -> None:
+        self._buckets.setdefault(lookup.key, {})[lookup] = None
+        heapq.heappush(self._expiry, (lookup.expires_at, next(self._counter), lookup))
+
+    def pop_matching(self, entry: discord.AuditLogEntry) -> list[Lookup]:
+        """Removes and returns all Lookups matching the entry."""
+
+        keys: list[LookupKey] = [(entry.action, None)]
+
+        if entry.target is not None:
+            keys.append((entry.action, entry.target.id))
+
+        matched = []
+
+        for key in keys:
+            bucket = self._buckets.get(key)
+
+            if bucket is None:
+                continue
+
+            for lookup in tuple(bucket):
+                if lookup.matches(entry):
+                    matched.append(lookup)
+                    self._discard(lookup)
+
+        return matched
+
+    def earliest_deadline(self) -> Optional[float]:
+        """The time at which the most urgent pending Lookup expires."""
+
+        # Drop Lookups that were resolved or cancelled in the meantime
+        while self._expiry and self._expiry[0][2].done():
+            _, _, lookup = heapq.heappop(self._expiry)
+            self._discard(lookup)
+
+        if self._expiry:
+            return self._expiry[0][0]
+
+    def remove_expired(self) -> None:
+        """Resolves expired Lookups with None."""
+
+        now = time.monotonic()
+
+        while self._expiry and self._expiry[0][0] < now:
+            _, _, lookup = heapq.heappop(self._expiry)
+
+            lookup.set_result(None)
+            self._discard(lookup)
+
+    def _discard(self, lookup: Lookup) -> None:
+        bucket = self._buckets.get(lookup.key)
+
+        if bucket is None:
+            return
+
+        bucket.pop(lookup, None)
+
+        if not bucket:
+            del self._buckets[lookup.key]
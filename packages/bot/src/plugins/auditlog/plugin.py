@@ -24,17 +24,40 @@ import asyncio
 import collections
 import datetime
 import re
-from typing import Optional, Union
+import statistics
+import time
+from typing import Any, Optional, Union
 
 import aiohttp
 import discord
 
 from ... import Mousey, Plugin
-from ...utils import create_task
-from .lookup import CheckFunction, Lookup
+from .lookup import CheckFunction, Lookup, PendingLookups
+from .scheduler import FetchScheduler
 
 
 FETCH_INTERVAL = 2
+# Entries are usually received via the gateway, only poll for ones we may have missed
+FALLBACK_FETCH_INTERVAL = 3
+
+# Guilds whose fetches don't resolve anything are polled less often
+BACKOFF_FACTOR = 2
+MAX_FETCH_INTERVAL = 8
+
+# Maximum amount of audit log requests running at once
+MAX_CONCURRENT_FETCHES = 4
+
+# Amount of resolution times kept for statistics
+LATENCY_SAMPLES = 1000
+
+# How far back entries may be to match a Lookup
+ENTRY_WINDOW = 16
+# Amount of processed entries kept per guild for late Lookups
+RECENT_ENTRIES = 100
+
+
+def window_start() -> datetime.datetime:
+    return discord.utils.utcnow() - datetime.timedelta(seconds=ENTRY_WINDOW)
 
 
 class AuditLog(Plugin):
@@ -46,17 +69,42 @@ class AuditLog(Plugin):
 
     Note that most of the time this functionality will not actually be useful,
     however it should still provide a nice(r) interface to fetch a specific entry.
+
+    Each guild keeps a cursor per action type, so only entries newer than the last
+    processed one are requested. Processed entries are kept around for a short while
+    to resolve Lookups which are created after their entry was already fetched.
+
+    If the moderation intent is enabled entries are also received from the gateway as they are created,
+    which resolves most Lookups right away. Polling then only serves as a less frequent fallback for missed events.
+
+    Polling is coordinated by a shard-wide FetchScheduler, which limits concurrent requests and backs off guilds
+    whose fetches don't resolve anything, so a cross-guild event doesn't have every guild compete for rate limits.
     """
 
     def __init__(self, mousey: Mousey):
         super().__init__(mousey)
 
-        self._tasks: dict[int, asyncio.Task[None]] = {}
-        self._lookups: collections.defaultdict[int, set[Lookup]] = collections.defaultdict(set)
+        self._push: bool = mousey.intents.moderation
+        self._lookups: collections.defaultdict[int, PendingLookups] = collections.defaultdict(PendingLookups)
+
+        self._cursors: collections.defaultdict[int, dict[discord.AuditLogAction, int]] = collections.defaultdict(dict)
+        self._recent: collections.defaultdict[int, collections.deque[discord.AuditLogEntry]] = collections.defaultdict(
+            lambda: collections.deque(maxlen=RECENT_ENTRIES)
+        )
+
+        self._latencies: collections.deque[float] = collections.deque(maxlen=LATENCY_SAMPLES)
+
+        self._scheduler: FetchScheduler = FetchScheduler(
+            self._poll_guild,
+            self._get_deadline,
+            interval=FALLBACK_FETCH_INTERVAL if self._push else FETCH_INTERVAL,
+            max_interval=MAX_FETCH_INTERVAL,
+            backoff=BACKOFF_FACTOR,
+            concurrency=MAX_CONCURRENT_FETCHES,
+        )
 
     def cog_unload(self) -> None:
-        for task in self._tasks.values():
-            task.cancel()
+        self._scheduler.stop()
 
     async def fetch_entry(
         self,
@@ -71,72 +119,181 @@ class AuditLog(Plugin):
 
         if not guild.me.guild_permissions.view_audit_log:
             lookup.set_result(None)
-        else:
+        elif not self._check_recent_entries(guild.id, lookup):
             self._queue(guild.id, lookup)
 
         return await lookup.wait()
 
+    async def fetch_entries(
+        self,
+        guild: discord.Guild,
+        action: discord.AuditLogAction,
+        checks: list[CheckFunction],
+        *,
+        target: Optional[discord.abc.Snowflake] = None,
+        timeout: float = 8,
+    ) -> list[Union[discord.AuditLogEntry, None]]:
+        """
+        Looks up entries for multiple changes which Discord usually records in a single entry.
+
+        Only one Lookup is pending at a time, matching any of the remaining checks.
+        If an entry does not satisfy every check another Lookup is made for the rest.
+        Results are returned in the same order as the checks.
+        """
+
+        results: list[Union[discord.AuditLogEntry, None]] = [None] * len(checks)
+        remaining = list(range(len(checks)))
+
+        def check(entry: discord.AuditLogEntry) -> bool:
+            return any(checks[idx](entry) for idx in remaining)
+
+        deadline = time.monotonic() + timeout
+
+        while remaining:
+            entry = await self.fetch_entry(
+                guild, action, target=target, check=check, timeout=max(deadline - time.monotonic(), 0)
+            )
+
+            if entry is None:
+                break
+
+            for idx in tuple(remaining):
+                if checks[idx](entry):
+                    results[idx] = entry
+                    remaining.remove(idx)
+
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        """Current queue depth and recent Lookup resolution times in seconds."""
+
+        latencies = sorted(self._latencies)
+
+        data = {
+            'queued_guilds': self._scheduler.queue_depth,
+            'active_fetches': self._scheduler.active_fetches,
+            'pending_lookups': sum(map(len, self._lookups.values())),
+            'resolved_lookups': len(latencies),
+        }
+
+        if latencies:
+            data['latency_median'] = statistics.median(latencies)
+            data['latency_p95'] = latencies[int(len(latencies) * 0.95)]
+            data['latency_max'] = latencies[-1]
+
+        return data
+
     def cancel_guild_task(self, guild_id: int) -> None:
-        try:
-            del self._lookups[guild_id]
-        except KeyError:
-            pass
+        for mapping in (self._lookups, self._cursors, self._recent):
+            try:
+                del mapping[guild_id]
+            except KeyError:
+                pass
 
-        try:
-            self._tasks.pop(guild_id).cancel()
-        except KeyError:
-            pass
+        self._scheduler.remove(guild_id)
 
     def _queue(self, guild_id: int, lookup: Lookup) -> None:
-        task = self._tasks.get(guild_id)
         self._lookups[guild_id].add(lookup)
+        self._scheduler.schedule(guild_id)
+
+    def _get_deadline(self, guild_id: int) -> Optional[float]:
+        lookups = self._lookups.get(guild_id)
 
-        if task is None or task.done():
-            self._tasks[guild_id] = create_task(self._do_lookups(guild_id))
+        if lookups is not None:
+            return lookups.earliest_deadline()
 
-    async def _do_lookups(self, guild_id: int) -> None:
-        while self._lookups[guild_id]:
-            await asyncio.sleep(FETCH_INTERVAL)
-            self._remove_expired_entries(guild_id)
+    async def _poll_guild(self, guild_id: int) -> int:
+        lookups = self._lookups.get(guild_id)
+
+        if lookups is None:
+            return 0
+
+        lookups.remove_expired()
+
+        if not lookups:
+            del self._lookups[guild_id]
+            return 0
 
-            if self._lookups[guild_id]:
-                await self._perform_lookup(guild_id)
+        return await self._perform_lookup(guild_id)
 
-    async def _perform_lookup(self, guild_id: int) -> None:
+    async def _perform_lookup(self, guild_id: int) -> int:
         guild = self.mousey.get_guild(guild_id)
 
         if guild is None:
-            return
+            return 0
 
-        entries: list[discord.AuditLogEntry] = []
+        cursors = self._cursors[guild_id]
+        actions = self._lookups[guild_id].actions
 
-        now = discord.utils.utcnow()
-        start = now - datetime.timedelta(seconds=16)
+        # Entries older than the window can't match, even if nothing was processed yet
+        minimum = discord.utils.time_snowflake(window_start())
+        after = min(max(cursors.get(x, minimum), minimum) for x in actions)
 
-        try:
-            async for entry in guild.audit_logs(limit=None):
-                if entry.created_at < start:
-                    break
+        # The API only allows filtering for a single action type
+        action = next(iter(actions)) if len(actions) == 1 else None
+
+        entries: list[discord.AuditLogEntry] = []
 
+        try:
+            async for entry in guild.audit_logs(limit=None, after=discord.Object(id=after), action=action):
                 entries.append(entry)
         except (asyncio.TimeoutError, aiohttp.ClientError, discord.HTTPException):
-            return
+            return 0
 
         # Resolve Lookups in chronological event order if possible
-        for entry in reversed(entries):
-            await self._check_entry(guild_id, entry)
+        entries.sort(key=lambda x: x.id)
+
+        if entries:
+            for action in actions:
+                cursors[action] = max(cursors.get(action, 0), entries[-1].id)
 
-    async def _check_entry(self, guild_id: int, entry: discord.AuditLogEntry) -> None:
-        for lookup in tuple(self._lookups[guild_id]):
-            if not lookup.matches(entry):
-                continue
+        resolved = 0
+        recent = self._recent[guild_id]
 
+        for entry in entries:
             self._augment_entry(entry)
+            recent.append(entry)
 
-            lookup.set_result(entry)
-            self._lookups[guild_id].remove(lookup)
+            resolved += await self._check_entry(guild_id, entry)
+
+        return resolved
+
+    def _check_recent_entries(self, guild_id: int, lookup: Lookup) -> bool:
+        recent = self._recent.get(guild_id)
+
+        if not recent:
+            return False
+
+        start = window_start()
+
+        for entry in recent:
+            if entry.created_at >= start and lookup.matches(entry):
+                self._resolve(lookup, entry)
+                return True
+
+        return False
+
+    async def _check_entry(self, guild_id: int, entry: discord.AuditLogEntry) -> int:
+        lookups = self._lookups.get(guild_id)
 
-            await asyncio.sleep(0)  # Yield to wake up Futures in order, hopefully
+        if not lookups:
+            return 0
+
+        matched = lookups.pop_matching(entry)
+
+        if not matched:
+            return 0
+
+        for lookup in matched:
+            self._resolve(lookup, entry)
+
+        await asyncio.sleep(0)  # Yield to wake up Futures in order, hopefully
+        return len(matched)
+
+    def _resolve(self, lookup: Lookup, entry: discord.AuditLogEntry) -> None:
+        if not lookup.done():
+            lookup.set_result(entry)
+            self._latencies.append(time.monotonic() - lookup.created_at)
 
     def _augment_entry(self, entry: discord.AuditLogEntry) -> None:
         if entry.user is None or entry.reason is None or not entry.user.bot:
@@ -166,17 +323,18 @@ class AuditLog(Plugin):
         else:
             entry.reason = match.group('reason').strip()
 
-    def _remove_expired_entries(self, guild_id: int) -> None:
-        active: set[Lookup] = set()
-        lookups = self._lookups[guild_id]
+    @Plugin.listener()
+    async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry) -> None:
+        # Gateway entries only contain cached users, let polling resolve the rest
+        if entry.user is None:
+            return
 
-        for lookup in lookups:
-            if not lookup.is_expired():
-                active.add(lookup)
-            else:
-                lookup.set_result(None)
+        # Cursors are intentionally not moved forward here,
+        # So polling can still pick up entries the gateway did not send us
+        self._augment_entry(entry)
+        self._recent[entry.guild.id].append(entry)
 
-        self._lookups[guild_id] = active
+        await self._check_entry(entry.guild.id, entry)
 
     @Plugin.listener()
     async def on_guild_remove(self, guild: discord.Guild) -> None:
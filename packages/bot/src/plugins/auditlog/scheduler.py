@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from ...utils import create_task
+
+
+log = logging.getLogger(__name__)
+
+
+# Poll shortly before the most urgent Lookup expires, even when backed off
+DEADLINE_MARGIN = 0.5
+
+FetchFunction = Callable[[int], Awaitable[int]]
+DeadlineFunction = Callable[[int], Optional[float]]
+
+
+class FetchScheduler:
+    """
+    Decides when guilds with pending Lookups fetch their audit log.
+
+    Due guilds are served in order of their most urgent Lookup, and a semaphore caps
+    how many audit log requests are running at once across the whole shard.
+
+    Guilds whose fetches did not resolve anything back off exponentially up to a maximum interval,
+    however every guild is always polled once shortly before its most urgent Lookup expires.
+    """
+
+    def __init__(
+        self,
+        fetch: FetchFunction,
+        deadline: DeadlineFunction,
+        *,
+        interval: float,
+        max_interval: float,
+        backoff: float,
+        concurrency: int,
+    ) -> None:
+        self._fetch: FetchFunction = fetch
+        self._deadline: DeadlineFunction = deadline
+
+        self.interval: float = interval
+        self.max_interval: float = max_interval
+
+        self.backoff: float = backoff
+        self.concurrency: int = concurrency
+
+        self._next_poll: dict[int, float] = {}
+        self._intervals: dict[int, float] = {}
+
+        self._polling: dict[int, asyncio.Task[None]] = {}
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: asyncio.Task[None] = create_task(self._run())
+
+    @property
+    def queue_depth(self) -> int:
+        """Amount of guilds waiting to be polled."""
+
+        return len(self._next_poll)
+
+    @property
+    def active_fetches(self) -> int:
+        return len(self._polling)
+
+    def stop(self) -> None:
+        self._task.cancel()
+
+        for task in self._polling.values():
+            task.cancel()
+
+    def schedule(self, guild_id: int) -> None:
+        """Ensures a guild is polled before its most urgent Lookup expires."""
+
+        if guild_id in self._polling:
+            return  # Rescheduled once the current poll finishes
+
+        self._reschedule(guild_id)
+
+    def remove(self, guild_id: int) -> None:
+        self._next_poll.pop(guild_id, None)
+        self._intervals.pop(guild_id, None)
+
+        try:
+            self._polling.pop(guild_id).cancel()
+        except KeyError:
+            pass
+
+    def _reschedule(self, guild_id: int) -> None:
+        deadline = self._deadline(guild_id)
+
+        if deadline is None:
+            self.remove(guild_id)
+            return
+
+        now = time.monotonic()
+        interval = self._intervals.setdefault(guild_id, self.interval)
+
+        # Poll right before the deadline if it is too close for another full interval,
+        # Once it has passed the next poll only serves to resolve expired Lookups
+        at = min(now + interval, max(deadline - DEADLINE_MARGIN, now + self.interval))
+
+        # Keep an earlier time if the guild was already scheduled
+        self._next_poll[guild_id] = min(at, self._next_poll.get(guild_id, at))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+
+            now = time.monotonic()
+            due = [guild_id for guild_id, at in self._next_poll.items() if at <= now]
+
+            # Serve the most urgent guilds first in case we need to wait for the semaphore
+            due.sort(key=lambda x: self._deadline(x) or now)
+
+            for guild_id in due:
+                await self._semaphore.acquire()
+
+                # Guild may have been removed while waiting
+                if self._next_poll.pop(guild_id, None) is None:
+                    self._semaphore.release()
+                else:
+                    self._polling[guild_id] = create_task(self._poll(guild_id))
+
+            if not self._next_poll:
+                timeout = None
+            else:
+                timeout = min(self._next_poll.values()) - time.monotonic()
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, guild_id: int) -> None:
+        try:
+            resolved = await self._fetch(guild_id)
+        except Exception:
+            log.exception(f'Unexpected exception fetching audit log entries for guild {guild_id}.')
+            resolved = 0
+        finally:
+            self._polling.pop(guild_id, None)
+            self._semaphore.release()
+
+        interval = self._intervals.get(guild_id, self.interval)
+
+        if resolved:
+            self._intervals[guild_id] = self.interval
+        else:
+            self._intervals[guild_id] = min(interval * self.backoff, self.max_interval)
+
+        self._reschedule(guild_id)
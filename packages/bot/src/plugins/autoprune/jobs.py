@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import time
+from typing import Iterable, Optional
+
+import aredis
+import discord
+
+from ... import InfractionEvent, Mousey
+from ...utils import create_task
+
+
+log = logging.getLogger(__name__)
+
+
+# Moderator permissions - ignore these users unconditionally
+PERMISSIONS = discord.Permissions(administrator=True, ban_members=True, kick_members=True, manage_messages=True)
+
+# Kicks share a per-guild rate limit, more workers only end up waiting on it
+WORKERS_PER_JOB = 3
+# Upper bound of kicks in flight across all guilds
+MAX_CONCURRENT_KICKS = 10
+
+# How often progress is saved, reported, and kick events are dispatched
+CHECKPOINT_INTERVAL = 5
+
+# Guild IDs with an unfinished job
+JOBS_KEY = 'mousey:prune-jobs'
+
+
+def job_key(guild_id: int) -> str:
+    return f'mousey:prune-jobs:{guild_id}'
+
+
+def members_key(guild_id: int) -> str:
+    return f'mousey:prune-jobs:{guild_id}:members'
+
+
+def is_protected(member: discord.Member) -> bool:
+    return member.top_role >= member.guild.me.top_role or bool(member.guild_permissions.value & PERMISSIONS.value)
+
+
+class PruneJob:
+    """Members of a guild which are being kicked, and the progress made so far."""
+
+    def __init__(self, guild: discord.Guild, reason: str, member_ids: Iterable[int], total: int) -> None:
+        self.guild: discord.Guild = guild
+        self.reason: str = reason
+
+        self.total: int = total
+        self.kicked: int = 0
+        self.failed: int = 0
+        self.skipped: int = 0
+
+        self.started_at: float = time.monotonic()
+        self.finished: asyncio.Event = asyncio.Event()
+
+        self.remaining: collections.deque[int] = collections.deque(member_ids)
+        # Members whose kick was saved at a checkpoint, including those of a previous run
+        self.completed: int = total - len(self.remaining)
+
+        # Processed since the last checkpoint
+        self.pending_ids: list[int] = []
+        self.pending_events: list[InfractionEvent] = []
+
+    @property
+    def rate(self) -> float:
+        """Kicks per second since the job was (re)started."""
+
+        return self.kicked / max(time.monotonic() - self.started_at, 1)
+
+    async def wait(self) -> None:
+        await self.finished.wait()
+
+
+class PruneExecutor:
+    """
+    Kicks members of guilds in the background.
+
+    Each guild has at most one job, which is served by a few workers sharing a global limit of concurrent kicks.
+    Remaining members are checkpointed to Redis, so a job interrupted by a restart is resumed once the guild is available.
+
+    Kick events are collected and dispatched at every checkpoint instead of after each kick.
+    """
+
+    def __init__(self, mousey: Mousey) -> None:
+        self.mousey: Mousey = mousey
+
+        self.jobs: dict[int, PruneJob] = {}
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(MAX_CONCURRENT_KICKS)
+
+    def stop(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    def get_job(self, guild: discord.abc.Snowflake) -> Optional[PruneJob]:
+        return self.jobs.get(guild.id)
+
+    async def start(self, guild: discord.Guild, members: list[discord.Member], reason: str) -> PruneJob:
+        if guild.id in self.jobs:
+            raise RuntimeError(f'Guild {guild.id} already has a prune job.')
+
+        member_ids = [x.id for x in members]
+        job = PruneJob(guild, reason, member_ids, len(member_ids))
+
+        # Claim the guild before saving, so it is not resumed at the same time
+        self.jobs[guild.id] = job
+        redis = self.mousey.redis
+
+        try:
+            await redis.delete(members_key(guild.id))
+            await redis.sadd(members_key(guild.id), *member_ids)
+            await redis.hmset(job_key(guild.id), {'reason': reason, 'total': job.total})
+
+            await redis.sadd(JOBS_KEY, guild.id)
+        except aredis.RedisError:
+            del self.jobs[guild.id]
+            raise
+
+        self._run(job)
+        return job
+
+    async def resume(self) -> None:
+        redis = self.mousey.redis
+
+        for guild_id in map(int, await redis.smembers(JOBS_KEY)):
+            guild = self.mousey.get_guild(guild_id)
+
+            # Guilds of other shards are resumed by their own process
+            if guild is None or guild_id in self.jobs:
+                continue
+
+            data = await redis.hgetall(job_key(guild_id))
+            member_ids = [int(x) for x in await redis.smembers(members_key(guild_id))]
+
+            if guild_id in self.jobs:
+                continue  # Started while loading
+
+            if not data or not member_ids:
+                await self._finish(guild_id)
+                continue
+
+            job = PruneJob(guild, data[b'reason'].decode(), member_ids, int(data[b'total']))
+            log.info(f'Resuming prune of guild {guild_id} with {len(member_ids)}/{job.total} members left.')
+
+            self._run(job)
+
+    def _run(self, job: PruneJob) -> None:
+        self.jobs[job.guild.id] = job
+        self._tasks[job.guild.id] = create_task(self._run_job(job))
+
+    async def _run_job(self, job: PruneJob) -> None:
+        guild_id = job.guild.id
+        workers: list[asyncio.Task[None]] = []
+
+        try:
+            # Members who are not cached would be skipped
+            if not job.guild.chunked:
+                members = self.mousey.get_cog('Members')
+                await members.chunk_guild(job.guild)
+
+            workers = [create_task(self._work(job)) for _ in range(WORKERS_PER_JOB)]
+
+            while not all(x.done() for x in workers):
+                await asyncio.wait(workers, timeout=CHECKPOINT_INTERVAL)
+                await self._checkpoint(job)
+
+                log.info(
+                    f'Pruned {job.kicked} members of guild {guild_id}, '
+                    f'{job.completed}/{job.total} processed at {job.rate:.2f} kicks/s.'
+                )
+
+            # A worker which died may have taken members with it, which are left to be resumed
+            if not job.remaining and job.completed == job.total:
+                await self._finish(guild_id)
+            else:
+                log.warning(f'Prune of guild {guild_id} stopped with {job.total - job.completed} members left.')
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+            # Save what was done before being stopped
+            await self._checkpoint(job)
+
+            self.jobs.pop(guild_id, None)
+            self._tasks.pop(guild_id, None)
+
+            job.finished.set()
+
+    async def _work(self, job: PruneJob) -> None:
+        guild = job.guild
+        events = self.mousey.get_cog('Events')
+
+        while job.remaining:
+            member_id = job.remaining.popleft()
+            member = guild.get_member(member_id)
+
+            # Left or was given a moderator role after the job started
+            if member is None or is_protected(member):
+                job.skipped += 1
+                job.pending_ids.append(member_id)
+                continue
+
+            event = InfractionEvent(guild, member, guild.me, job.reason)
+
+            async with self._semaphore:
+                # Ignores expire quickly, waiting for the semaphore could take longer
+                events.ignore(guild, 'mouse_member_kick', event)
+
+                try:
+                    await member.kick(reason=job.reason)
+                except discord.HTTPException:
+                    job.failed += 1
+                else:
+                    job.kicked += 1
+                    job.pending_events.append(event)
+
+            job.pending_ids.append(member_id)
+
+    async def _checkpoint(self, job: PruneJob) -> None:
+        events, job.pending_events = job.pending_events, []
+
+        for event in events:
+            self.mousey.dispatch('mouse_member_kick', event)
+
+        completed, job.pending_ids = job.pending_ids, []
+
+        if not completed:
+            return
+
+        job.completed += len(completed)
+
+        try:
+            await self.mousey.redis.srem(members_key(job.guild.id), *completed)
+        except aredis.RedisError:
+            # Members are skipped if the job is resumed after they were kicked
+            log.warning(f'Unable to save prune progress of guild {job.guild.id}.')
+
+    async def _finish(self, guild_id: int) -> None:
+        redis = self.mousey.redis
+
+        await redis.delete(job_key(guild_id), members_key(guild_id))
+        await redis.srem(JOBS_KEY, guild_id)
@@ -25,15 +25,14 @@ import typing
 import discord
 from discord.ext import tasks
 
-from ... import InfractionEvent, NotFound, Plugin
+from ... import NotFound, Plugin
+from ...utils import create_task
 from .enums import ActivityType
+from .jobs import PERMISSIONS, PruneExecutor
 
 
 log = logging.getLogger(__name__)
 
-# Moderator permissions - ignore these users unconditionally
-PERMISSIONS = discord.Permissions(administrator=True, ban_members=True, kick_members=True, manage_messages=True)
-
 
 def has_no_roles(member):
     return len(member.roles) == 1
@@ -46,48 +45,39 @@ def has_any_role(role_ids):
     return check
 
 
+# Activity checks receive all candidates at once and return the inactive members
 def joined_before(config):
     now = discord.utils.utcnow()
     timeout = config.inactive_timeout.total_seconds()
 
-    async def check(member):
-        if member.joined_at is None:
-            return False
-
-        return (now - member.joined_at).total_seconds() >= timeout
+    async def check(members):
+        return [x for x in members if x.joined_at is not None and (now - x.joined_at).total_seconds() >= timeout]
 
     return check
 
 
 def seen_before(config, mousey):
-    now = datetime.datetime.utcnow()
-    timeout = config.inactive_timeout.total_seconds()
-
+    before = datetime.datetime.utcnow() - config.inactive_timeout
     tracking = mousey.get_cog('Tracking')
 
-    async def check(member):
-        status = await tracking.get_last_status(member)
-
+    async def check(members):
         # Default to rule setup date
         # To allow pruning members never seen
-        return (now - (status.seen or config.updated_at)).total_seconds() >= timeout
+        inactive = await tracking.bulk_inactive(members, before, config.updated_at)
+        return [x for x in members if x.id in inactive]
 
     return check
 
 
 def status_before(config, mousey):
-    now = datetime.datetime.utcnow()
-    timeout = config.inactive_timeout.total_seconds()
-
+    before = datetime.datetime.utcnow() - config.inactive_timeout
     tracking = mousey.get_cog('Tracking')
 
-    async def check(member):
-        status = await tracking.get_last_status(member)
-
+    async def check(members):
         # Default to rule setup date
         # To allow pruning members never online or seen
-        seen = (status.status, status.seen, config.updated_at)
-        return (now - max(filter(None, seen))).total_seconds() >= timeout
+        inactive = await tracking.bulk_inactive(members, before, config.updated_at, include_status=True)
+        return [x for x in members if x.id in inactive]
 
     return check
 
@@ -106,10 +96,19 @@ class AutoPrune(Plugin):
     def __init__(self, mousey):
         super().__init__(mousey)
 
+        self.executor = PruneExecutor(mousey)
         self.do_prune.start()
 
+        if mousey.is_ready():
+            create_task(self.executor.resume())
+
     def cog_unload(self):
         self.do_prune.stop()
+        self.executor.stop()
+
+    @Plugin.listener()
+    async def on_ready(self):
+        await self.executor.resume()
 
     @tasks.loop(hours=24)
     async def do_prune(self):
@@ -127,7 +126,11 @@ class AutoPrune(Plugin):
             data['inactive_timeout'] = datetime.timedelta(seconds=data['inactive_timeout'])
 
             config = PruneConfig(**data)
-            await self._do_guild_prune(config)
+
+            try:
+                await self._do_guild_prune(config)
+            except Exception:
+                log.exception(f'Failed to prune guild {config.guild_id}.')
 
     async def _do_guild_prune(self, config):
         guild = self.mousey.get_guild(config.guild_id)
@@ -138,8 +141,12 @@ class AutoPrune(Plugin):
         if not guild.me.guild_permissions.kick_members:
             return
 
+        if self.executor.get_job(guild) is not None:
+            return  # Still working through a previous prune
+
         if not guild.chunked:
-            await guild.chunk()
+            members = self.mousey.get_cog('Members')
+            await members.chunk_guild(guild)
 
         if not config.role_ids:
             role_check = has_no_roles
@@ -155,8 +162,7 @@ class AutoPrune(Plugin):
 
         me = guild.me
 
-        events = self.mousey.get_cog('Events')
-        reason = 'Automatic prune due to inactivity'
+        candidates = []
 
         for member in guild.members:
             if member.bot or member.top_role >= me.top_role:
@@ -166,13 +172,11 @@ class AutoPrune(Plugin):
             if permissions.value & PERMISSIONS.value != 0:  # Mod
                 continue
 
-            if role_check(member) and await activity_check(member):
-                event = InfractionEvent(guild, member, me, reason)
-                events.ignore(guild, 'mouse_member_kick', event)
+            if role_check(member):
+                candidates.append(member)
+
+        members = await activity_check(candidates)
 
-                try:
-                    await member.kick(reason=reason)
-                except discord.HTTPException:
-                    pass
-                else:
-                    self.mousey.dispatch('mouse_member_kick', event)
+        # A manual prune may have been started while members were being checked
+        if members and self.executor.get_job(guild) is None:
+            await self.executor.start(guild, members, 'Automatic prune due to inactivity')
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+
+
+class PrefixMatcher:
+    """
+    Matches message content against a guild's command prefixes.
+
+    Prefixes are compiled into a single regex alternation, tried in the given order like discord.py does.
+    Content not starting with the first character of any prefix is rejected without running the regex.
+    """
+
+    __slots__ = ('prefixes', '_first_chars', '_pattern')
+
+    def __init__(self, prefixes):
+        self.prefixes = prefixes = [x for x in prefixes if x]
+
+        self._first_chars = frozenset(x[0] for x in prefixes)
+        self._pattern = re.compile('|'.join(map(re.escape, prefixes)))
+
+    def match(self, content):
+        """Returns the prefix the content starts with, or None if it can not be a command."""
+
+        if not content or content[0] not in self._first_chars:
+            return None
+
+        match = self._pattern.match(content)
+        return match and match.group()
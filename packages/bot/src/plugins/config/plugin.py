@@ -18,15 +18,40 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import collections
+import json
+import logging
 import typing
 
+import aredis
 from discord.ext import commands
 
 from ... import ConfigUpdateEvent, NotFound, Plugin, bot_has_permissions, group
+from ...utils import create_task
 from .logging import LoggingMenu
+from .matcher import PrefixMatcher
 from .prefixes import PrefixMenu
 
 
+log = logging.getLogger(__name__)
+
+# The API announces config changes made by anyone here
+INVALIDATION_CHANNEL = 'mousey:invalidate'
+INVALIDATION_RETRY_DELAY = 5
+
+# Upper bound of guilds cached with and without required roles
+PERMISSION_CACHE_SIZE = 10_000
+
+# Responses APIClient caches for each kind of config
+CACHED_PATHS = {
+    'groups': '/guilds/{}/groups',
+    'modlogs': '/guilds/{}/modlogs',
+    'permissions': '/guilds/{}/permissions',
+    'prefixes': '/guilds/{}/prefixes',
+}
+
+
 class PermissionConfig(typing.NamedTuple):
     required_roles: typing.List[int] = []
 
@@ -43,10 +68,25 @@ class Config(Plugin):
         super().__init__(mousey)
 
         self._prefixes = {}
-        self._permissions = {}
+
+        # Guilds with required roles, guilds known to have none
+        self._permissions = collections.OrderedDict()
+        self._unrestricted = collections.OrderedDict()
+
+        # Compiled from the mention prefixes and custom prefixes of a guild
+        self._matchers = {}
 
         self._max_concurrency = commands.MaxConcurrency(1, per=commands.BucketType.channel, wait=False)
 
+        self._warm_up_task = None
+        self._invalidation_task = create_task(self._listen_for_invalidations())
+
+        if mousey.is_ready():
+            self._start_warm_up()
+
+    def cog_unload(self):
+        self._invalidation_task.cancel()
+
     def cog_check(self, ctx):
         return ctx.author.guild_permissions.administrator
 
@@ -57,6 +97,11 @@ class Config(Plugin):
         await self._max_concurrency.release(ctx)
 
     async def bot_check(self, ctx):
+        # Most guilds never set up required roles
+        if ctx.guild.id in self._unrestricted:
+            self._unrestricted.move_to_end(ctx.guild.id)
+            return True
+
         permissions = await self.get_permissions(ctx.guild)
 
         if not permissions.required_roles:
@@ -100,17 +145,120 @@ class Config(Plugin):
         await PrefixMenu(context=ctx).start()
 
     @Plugin.listener()
-    async def on_mouse_config_update(self, event):
+    async def on_ready(self):
+        self._start_warm_up()
+
+    def _start_warm_up(self):
+        if self._warm_up_task is None or self._warm_up_task.done():
+            self._warm_up_task = create_task(self._warm_up())
+
+    async def _warm_up(self):
+        # Load the config of every guild on this shard in a few requests,
+        # Instead of sending one request per guild when it is first used
+        shard_id = self.mousey.shard_id
+
         try:
-            del self._prefixes[event.guild.id]
-        except KeyError:
-            pass
+            prefixes = await self.mousey.api.get_shard_prefixes(shard_id)
+        except NotFound:
+            prefixes = []
+
+        try:
+            permissions = await self.mousey.api.get_shard_permissions(shard_id)
+        except NotFound:
+            permissions = []
+
+        prefixes = {x['guild_id']: x['prefixes'] for x in prefixes}
+        permissions = {x['guild_id']: x['required_roles'] for x in permissions}
 
-    def dispatch_config_update(self, guild):
-        event = ConfigUpdateEvent(guild)
+        # Anything set while the requests were in flight is more recent
+        for guild in self.mousey.guilds:
+            self._prefixes.setdefault(guild.id, prefixes.get(guild.id, []))
+
+            if guild.id not in self._permissions and guild.id not in self._unrestricted:
+                self._cache_permissions(guild.id, PermissionConfig(permissions.get(guild.id, [])))
+
+    async def _wait_for_warm_up(self):
+        if self._warm_up_task is not None and not self._warm_up_task.done():
+            await asyncio.wait([self._warm_up_task])
+
+    @Plugin.listener()
+    async def on_mouse_config_update(self, event):
+        if event.kind in (None, 'prefixes'):
+            self._prefixes.pop(event.guild.id, None)
+            self._matchers.pop(event.guild.id, None)
+
+        if event.kind in (None, 'permissions'):
+            self._permissions.pop(event.guild.id, None)
+            self._unrestricted.pop(event.guild.id, None)
+
+    @Plugin.listener()
+    async def on_mouse_guild_remove(self, event):
+        self._prefixes.pop(event.guild.id, None)
+        self._matchers.pop(event.guild.id, None)
+
+        self._permissions.pop(event.guild.id, None)
+        self._unrestricted.pop(event.guild.id, None)
+
+    def dispatch_config_update(self, guild, kind=None):
+        event = ConfigUpdateEvent(guild, kind)
         self.mousey.dispatch('mouse_config_update', event)
 
+    async def _listen_for_invalidations(self):
+        while True:
+            pubsub = self.mousey.redis.pubsub(ignore_subscribe_messages=True)
+
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+
+                while True:
+                    message = await pubsub.listen()
+
+                    if message is None:
+                        continue
+
+                    try:
+                        self._invalidate(**json.loads(message['data']))
+                    except (TypeError, ValueError):
+                        log.exception(f'Received invalid config invalidation {message["data"]!r}.')
+            except aredis.RedisError:
+                pass
+            finally:
+                pubsub.close()
+
+            # Changes may have been missed while disconnected
+            self._reset()
+            self._start_warm_up()
+
+            await asyncio.sleep(INVALIDATION_RETRY_DELAY)
+
+    def _reset(self):
+        # Drops the config of every guild at once instead of dispatching an update per guild
+        for guild in self.mousey.guilds:
+            for path in CACHED_PATHS.values():
+                self.mousey.api.invalidate(path.format(guild.id))
+
+        self._prefixes.clear()
+        self._matchers.clear()
+
+        self._permissions.clear()
+        self._unrestricted.clear()
+
+        self.mousey.dispatch('mouse_config_reset')
+
+    def _invalidate(self, guild_id, kind=None):
+        for name, path in CACHED_PATHS.items():
+            if kind is None or kind == name:
+                self.mousey.api.invalidate(path.format(guild_id))
+
+        guild = self.mousey.get_guild(guild_id)
+
+        if guild is not None:
+            self.dispatch_config_update(guild, kind)
+
     async def get_prefixes(self, guild):
+        if guild.id not in self._prefixes:
+            await self._wait_for_warm_up()
+
         try:
             return self._prefixes[guild.id]
         except KeyError:
@@ -128,22 +276,67 @@ class Config(Plugin):
         prefixes = sorted(set(prefixes), reverse=True)
 
         self._prefixes[guild.id] = prefixes
+        self._matchers[guild.id] = self._create_matcher(prefixes)
+
         await self.mousey.api.set_prefixes(guild.id, prefixes)
 
+    async def match_prefix(self, message):
+        """Returns the prefix a message starts with, or None if it is not a command."""
+
+        try:
+            matcher = self._matchers[message.guild.id]
+        except KeyError:
+            prefixes = await self.get_prefixes(message.guild)
+            self._matchers[message.guild.id] = matcher = self._create_matcher(prefixes)
+
+        return matcher.match(message.content)
+
+    def _create_matcher(self, prefixes):
+        user_id = self.mousey.user.id
+        return PrefixMatcher([f'<@{user_id}>', f'<@!{user_id}>', *prefixes])
+
     async def get_permissions(self, guild):
+        if guild.id not in self._permissions and guild.id not in self._unrestricted:
+            await self._wait_for_warm_up()
+
+        if guild.id in self._unrestricted:
+            self._unrestricted.move_to_end(guild.id)
+            return PermissionConfig()
+
         try:
-            return self._permissions[guild.id]
+            permissions = self._permissions[guild.id]
         except KeyError:
             pass
+        else:
+            self._permissions.move_to_end(guild.id)
+            return permissions
 
         try:
-            permissions = await self.mousey.api.get_permissions(guild.id)
+            permissions = PermissionConfig(**await self.mousey.api.get_permissions(guild.id))
         except NotFound:
-            permissions = {}
+            permissions = PermissionConfig()
 
-        self._permissions[guild.id] = permissions = PermissionConfig(**permissions)
+        self._cache_permissions(guild.id, permissions)
         return permissions
 
     async def set_permissions(self, guild, permissions):
-        self._permissions[guild.id] = permissions
+        self._cache_permissions(guild.id, permissions)
         await self.mousey.api.set_permissions(guild.id, permissions.to_dict())
+
+    def _cache_permissions(self, guild_id, permissions):
+        if permissions.required_roles:
+            self._unrestricted.pop(guild_id, None)
+
+            cache = self._permissions
+            cache[guild_id] = permissions
+        else:
+            self._permissions.pop(guild_id, None)
+
+            cache = self._unrestricted
+            cache[guild_id] = None
+
+        cache.move_to_end(guild_id)
+
+        # Evicted guilds are loaded from the API again when needed
+        while len(cache) > PERMISSION_CACHE_SIZE:
+            cache.popitem(last=False)
@@ -19,8 +19,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
-import collections
-import datetime
+import heapq
 
 import discord
 
@@ -40,14 +39,12 @@ from ...events import (
     ThreadMemberChangeEvent,
     ThreadUpdateEvent,
 )
-from ...utils import call_later, create_task, set_none_result
+from ...utils import ExpiringDict, ExpiringSet, create_task, set_none_result
 
 
 KICK_TIMEOUT = 4
 DEFAULT_TIMEOUT = 8
 
-DUMMY_DATE = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
-
 TEXT_CHANNEL_THREAD_TYPES = (
     discord.ChannelType.public_thread,
     discord.ChannelType.private_thread,
@@ -81,30 +78,43 @@ class Events(Plugin):
 
         # Events dispatched by the bot
         # Which can be ignored from the gateway
-        self._ignored = set()
+        self._ignored = ExpiringSet(5)
 
         # Table of recent mentions and recipient messages in threads
         # Used to look up who is responsible for adding / removing thread members
-        self._thread_member_changes = {}
+        self._thread_member_changes = ExpiringDict(2)
+
+        # Pending futures which are looking up thread membership information
+        # Futures which have not been resolved once their keys expire resolve to None
+        self._thread_member_lookups = ExpiringDict(2, on_expire=self._expire_thread_member_lookups)
+
+        # Active timeouts by (guild_id, user_id)
+        self._timeouts = {}
 
-        # Pending tasks which are looking up thread membership information
-        self._thread_member_lookups = collections.defaultdict(list)
+        # Min-heap of (timed_out_until, guild_id, user_id)
+        # Entries no longer matching self._timeouts are skipped once they reach the top
+        self._timeout_heap = []
 
-        # Task tracking when timeouts globally
+        # Set when the soonest timeout may have changed
+        self._timeout_wakeup = asyncio.Event()
+
+        if mousey.is_ready():
+            for guild in mousey.guilds:
+                self._track_guild_timeouts(guild)
+
+        # Task tracking when timeouts resolve globally
         self._timeout_dispatcher = create_task(self._dispatch_timeout_resolve())
 
-        # guild_id, user_id, timestamp
-        # Of the timeout that resolves soonest globally
-        # We set this to a dummy value to simplify code
-        self._soonest_timeout_resolve = [None, None, DUMMY_DATE]
+    def cog_unload(self):
+        self._timeout_dispatcher.cancel()
+
+        for mapping in (self._ignored, self._thread_member_changes, self._thread_member_lookups):
+            mapping.stop()
 
     # Event helpers
 
     def ignore(self, guild, event_name, event):
-        key = (guild.id, event_name, *event.key)
-
-        self._ignored.add(key)
-        call_later(5, self._ignored.discard, key)
+        self._ignored.add((guild.id, event_name, *event.key))
 
     def is_ignored(self, guild, event_name, event):
         return (guild.id, event_name, *event.key) in self._ignored
@@ -112,47 +122,37 @@ class Events(Plugin):
     # Thread member helpers
 
     def _get_thread_member_change(self, thread, member, change):
-        self._remove_expired_thread_member_lookups()
-
         future = asyncio.Future()
-        call_later(2, set_none_result, future)
 
         for item in (member, *member.roles):
             key = (thread.id, item.id, change)
 
             if key in self._thread_member_changes:
                 future.set_result(self._thread_member_changes[key])
-            else:
-                self._thread_member_lookups[key].append(future)
+                break
 
-        return future
+            # Setting the key again extends its lifetime to cover this future
+            self._thread_member_lookups[key] = [*self._thread_member_lookups.get(key, ()), future]
 
-    def _remove_expired_thread_member_lookups(self):
-        previous = self._thread_member_lookups
-        self._thread_member_lookups = lookups = collections.defaultdict(list)
+        return future
 
-        for key, tasks in previous.items():
-            if not all(x.done() for x in tasks):
-                lookups[key] = tasks
+    def _expire_thread_member_lookups(self, key, futures):
+        for future in futures:
+            set_none_result(future)
 
     def _cache_thread_member_change(self, thread, member, moderator, change):
         key = (thread.id, member.id, change)
+        futures = self._thread_member_lookups.pop(key, None)
 
-        if key in self._thread_member_lookups:
-            for task in self._thread_member_lookups[key]:
-                try:
-                    task.set_result(moderator.id)
-                except asyncio.InvalidStateError:
-                    pass  # Future previously matched on another key
-        else:
+        if futures is None:
             self._thread_member_changes[key] = moderator.id
-            call_later(2, self._remove_cached_thread_member_change, key)
+            return
 
-    def _remove_cached_thread_member_change(self, key):
-        try:
-            del self._thread_member_changes[key]
-        except KeyError:
-            pass
+        for future in futures:
+            try:
+                future.set_result(moderator.id)
+            except asyncio.InvalidStateError:
+                pass  # Future previously matched on another key
 
     # Discord events
 
@@ -210,8 +210,8 @@ class Events(Plugin):
         old = set(before.roles)
         diff = old.symmetric_difference(set(after.roles))
 
-        # We only need to look up the audit log entry here once,
-        # However I think this approach is more readable (and smaller!)
+        changes = []
+
         for role in diff:
             if role not in old:
                 event_name = 'mouse_role_add'
@@ -225,8 +225,11 @@ class Events(Plugin):
             if role.managed:
                 self.mousey.dispatch(event_name, event)
             else:
-                action = discord.AuditLogAction.member_role_update
-                create_task(self._fetch_and_dispatch(after.guild, event_name, event, action, target=after, check=check))
+                changes.append((event_name, event, check))
+
+        if changes:
+            action = discord.AuditLogAction.member_role_update
+            create_task(self._fetch_and_dispatch_many(after.guild, changes, action, target=after))
 
     @Plugin.listener('on_member_update')
     async def on_member_timed_out_until_update(self, before, after):
@@ -236,20 +239,12 @@ class Events(Plugin):
         if old == new:
             return
 
-        # Previously closest timeout
-        guild_id, user_id, timestamp = self._soonest_timeout_resolve
-
         if new is not None:
             event_name = 'mouse_timeout_create'
-
-            if new <= timestamp or (self._timeout_dispatcher.done() or timestamp == DUMMY_DATE):
-                self._timeout_dispatcher.cancel()
-                self._timeout_dispatcher = create_task(self._dispatch_timeout_resolve())
         else:
             event_name = 'mouse_timeout_resolve'
 
-            if guild_id == after.guild.id and user_id == after.id:
-                self._timeout_dispatcher.cancel()
+        self._track_timeout(after)
 
         event = MemberUpdateEvent(after, old, new)
         action = discord.AuditLogAction.member_update
@@ -494,6 +489,8 @@ class Events(Plugin):
         )
 
     def _compare_and_dispatch(self, cls, kind, action, before, after, attrs):
+        changes = []
+
         for name in attrs:
             former = getattr(before, name, None)
             current = getattr(after, name, None)
@@ -504,8 +501,10 @@ class Events(Plugin):
                 event_name = f'mouse_{kind}_{name}_update'
 
                 check = match_attrs(name, former, current)
+                changes.append((event_name, event, check))
 
-                create_task(self._fetch_and_dispatch(after.guild, event_name, event, action, target=after, check=check))
+        if changes:
+            create_task(self._fetch_and_dispatch_many(after.guild, changes, action, target=after))
 
     async def _fetch_and_dispatch(self, guild, event_name, event, action, *, target=None, check=None, required=False):
         if self.is_ignored(guild, event_name, event):
@@ -527,6 +526,26 @@ class Events(Plugin):
         elif not required:
             self.mousey.dispatch(event_name, event)
 
+    async def _fetch_and_dispatch_many(self, guild, changes, action, *, target=None):
+        # Discord records changes made in a single request in one audit log entry,
+        # So changes of the same target are looked up together and the result is shared
+        changes = [x for x in changes if not self.is_ignored(guild, x[0], x[1])]
+
+        if not changes:
+            return
+
+        audit_log = self.mousey.get_cog('AuditLog')
+        checks = [check for _, _, check in changes]
+
+        entries = await audit_log.fetch_entries(guild, action, checks, target=target, timeout=DEFAULT_TIMEOUT)
+
+        for (event_name, event, _), entry in zip(changes, entries):
+            if entry is not None:
+                event.reason = entry.reason
+                event.moderator = entry.user
+
+            self.mousey.dispatch(event_name, event)
+
     # Bot events
 
     @Plugin.listener()
@@ -559,21 +578,72 @@ class Events(Plugin):
 
     # Timeout tracking
 
+    @Plugin.listener('on_guild_join')
+    @Plugin.listener('on_guild_available')
+    async def on_guild_timeouts_available(self, guild):
+        self._track_guild_timeouts(guild)
+
+    def _track_guild_timeouts(self, guild):
+        for member in guild.members:
+            if member.is_timed_out():
+                self._track_timeout(member)
+
+    def _track_timeout(self, member):
+        key = (member.guild.id, member.id)
+        timed_out_until = member.timed_out_until
+
+        if not member.is_timed_out():
+            self._timeouts.pop(key, None)  # Entry is skipped once it reaches the top of the heap
+            return
+
+        if self._timeouts.get(key) == timed_out_until:
+            return
+
+        self._timeouts[key] = timed_out_until
+        heapq.heappush(self._timeout_heap, (timed_out_until, *key))
+
+        if self._timeout_heap[0][0] == timed_out_until:
+            self._timeout_wakeup.set()
+
+    def _peek_timeout(self):
+        while self._timeout_heap:
+            timed_out_until, guild_id, user_id = self._timeout_heap[0]
+
+            if self._timeouts.get((guild_id, user_id)) == timed_out_until:
+                return self._timeout_heap[0]
+
+            heapq.heappop(self._timeout_heap)
+
     async def _dispatch_timeout_resolve(self):
         await self.mousey.wait_until_ready()
 
         while not self.mousey.is_closed():
-            members = filter(lambda x: x.is_timed_out(), self.mousey.get_all_members())
+            self._timeout_wakeup.clear()
+            soonest = self._peek_timeout()
 
-            try:
-                member = sorted(members, key=lambda x: x.timed_out_until)[0]
-            except IndexError:
-                return
+            if soonest is None:
+                await self._timeout_wakeup.wait()
+                continue
+
+            timed_out_until, guild_id, user_id = soonest
+            delay = (timed_out_until - discord.utils.utcnow()).total_seconds()
+
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._timeout_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    continue  # A sooner timeout was added
+
+            if self._peek_timeout() != soonest:
+                continue  # Timeout was removed or changed while waiting
 
-            timed_out_until = member.timed_out_until
-            self._soonest_timeout_resolve = (member.guild.id, member.id, timed_out_until)
+            heapq.heappop(self._timeout_heap)
+            del self._timeouts[(guild_id, user_id)]
 
-            now = discord.utils.utcnow()
-            await asyncio.sleep((timed_out_until - now).total_seconds())
+            guild = self.mousey.get_guild(guild_id)
+            member = guild and guild.get_member(user_id)
 
-            self.mousey.dispatch('mouse_timeout_resolve', MemberUpdateEvent(member, timed_out_until, None))
+            if member is not None:
+                self.mousey.dispatch('mouse_timeout_resolve', MemberUpdateEvent(member, timed_out_until, None))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sys
+from typing import Iterable
+
+import discord
+
+
+class MutualGuildIndex:
+    """
+    Maps user IDs to the IDs of cached guilds they are a member of.
+
+    Most users only share a single guild with the bot on a shard,
+    so the guild ID is stored directly until a second one is added.
+    """
+
+    __slots__ = ('_guilds',)
+
+    def __init__(self) -> None:
+        self._guilds: dict[int, int | set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    def get(self, user_id: int) -> Iterable[int]:
+        value = self._guilds.get(user_id)
+
+        if value is None:
+            return ()
+
+        if isinstance(value, int):
+            return (value,)
+
+        return tuple(value)
+
+    def add(self, user_id: int, guild_id: int) -> None:
+        value = self._guilds.get(user_id)
+
+        if value is None:
+            self._guilds[user_id] = guild_id
+        elif isinstance(value, int):
+            if value != guild_id:
+                self._guilds[user_id] = {value, guild_id}
+        else:
+            value.add(guild_id)
+
+    def remove(self, user_id: int, guild_id: int) -> None:
+        value = self._guilds.get(user_id)
+
+        if value is None:
+            return
+
+        if isinstance(value, int):
+            if value == guild_id:
+                del self._guilds[user_id]
+        else:
+            value.discard(guild_id)
+
+            if len(value) == 1:
+                self._guilds[user_id] = value.pop()
+
+    def add_guild(self, guild: discord.Guild) -> None:
+        for member in guild.members:
+            self.add(member.id, guild.id)
+
+    def remove_guild(self, guild: discord.Guild) -> None:
+        for member in guild.members:
+            self.remove(member.id, guild.id)
+
+    def clear(self) -> None:
+        self._guilds.clear()
+
+    def memory_usage(self) -> int:
+        """Approximate size of the index in bytes, not including IDs shared with the member cache."""
+
+        size = sys.getsizeof(self._guilds)
+
+        for value in self._guilds.values():
+            if not isinstance(value, int):
+                size += sys.getsizeof(value)
+
+        return size
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+
+import discord
+
+from ... import Plugin
+from .index import MutualGuildIndex
+
+
+log = logging.getLogger(__name__)
+
+
+class Members(Plugin):
+    """Keeps track of which cached guilds users are a member of."""
+
+    def __init__(self, mousey):
+        super().__init__(mousey)
+
+        self._index = MutualGuildIndex()
+
+        if mousey.is_ready():
+            self._rebuild_index()
+
+    def mutual_guilds(self, user: discord.abc.Snowflake) -> list[discord.Guild]:
+        guilds = []
+
+        for guild_id in self._index.get(user.id):
+            guild = self.mousey.get_guild(guild_id)
+
+            if guild is not None:
+                guilds.append(guild)
+
+        return guilds
+
+    def mutual_members(self, user: discord.abc.Snowflake) -> list[discord.Member]:
+        members = []
+
+        for guild in self.mutual_guilds(user):
+            member = guild.get_member(user.id)
+
+            if member is not None:
+                members.append(member)
+
+        return members
+
+    async def chunk_guild(self, guild: discord.Guild) -> None:
+        """Chunks a guild and adds all newly cached members to the index."""
+
+        await guild.chunk()
+        self._index.add_guild(guild)
+
+    def memory_usage(self) -> int:
+        return self._index.memory_usage()
+
+    def _rebuild_index(self) -> None:
+        self._index.clear()
+
+        for guild in self.mousey.guilds:
+            self._index.add_guild(guild)
+
+        log.info(f'Indexed {len(self._index)} users using {self.memory_usage() / 1024 ** 2:.2f}MiB.')
+
+    @Plugin.listener()
+    async def on_ready(self):
+        self._rebuild_index()
+
+    @Plugin.listener('on_guild_join')
+    @Plugin.listener('on_guild_available')
+    async def on_guild_create(self, guild):
+        self._index.add_guild(guild)
+
+    @Plugin.listener('on_guild_remove')
+    @Plugin.listener('on_guild_unavailable')
+    async def on_guild_delete(self, guild):
+        self._index.remove_guild(guild)
+
+    @Plugin.listener()
+    async def on_member_join(self, member):
+        self._index.add(member.id, member.guild.id)
+
+    @Plugin.listener()
+    async def on_member_remove(self, member):
+        self._index.remove(member.id, member.guild.id)
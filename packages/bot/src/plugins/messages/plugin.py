@@ -317,7 +317,8 @@ class Messages(Plugin):
             task = self._chunk_requests.get(guild.id)
 
             if task is None or task.done():
-                self._chunk_requests[guild.id] = create_task(guild.chunk())
+                members = self.mousey.get_cog('Members')
+                self._chunk_requests[guild.id] = create_task(members.chunk_guild(guild))
 
         return member
 
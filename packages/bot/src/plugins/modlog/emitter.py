@@ -20,6 +20,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
 import time
+from typing import Callable
 
 import aiohttp
 import discord
@@ -31,6 +32,10 @@ MAX_MESSAGE_SIZE = 1995
 EMPTY_MESSAGE_ERROR = 50006
 
 
+# Called with whether the content is done, meaning it was sent or can never be sent
+Callback = Callable[[bool], None]
+
+
 class EmitterInactive(Exception):
     pass
 
@@ -38,9 +43,9 @@ class EmitterInactive(Exception):
 class Emitter:
     __slots__ = ('buffer', 'channel', 'last_emit', 'task')
 
-    def __init__(self, channel: discord.TextChannel) -> None:
-        self.buffer: list[tuple[str, discord.abc.Snowflake | None]] = []
-        self.channel: discord.TextChannel = channel
+    def __init__(self, channel: discord.abc.Messageable) -> None:
+        self.buffer: list[tuple[str, discord.abc.Snowflake | None, Callback | None]] = []
+        self.channel: discord.abc.Messageable = channel
 
         self.last_emit: float = 0
         self.task: asyncio.Task[None] = create_task(self._emit())
@@ -49,15 +54,30 @@ class Emitter:
     def active(self) -> bool:
         return not self.task.cancelled()
 
-    def send(self, content: str, mention: discord.abc.Snowflake | None = None) -> None:
+    def send(
+        self, content: str, mention: discord.abc.Snowflake | None = None, callback: Callback | None = None
+    ) -> None:
+        """
+        Queues content to be sent to the channel.
+
+        The optional callback is called with True once the last part of the content has been sent,
+        or sending it failed in a way that retrying it would not help.
+        If sending failed in a way that retrying may help it is called with False instead, and the content is dropped.
+        """
+
         if not self.active:
             raise EmitterInactive
 
+        chunks = []
+
         for line in content.splitlines():
             length = len(line)
 
             for start in range(0, length, MAX_MESSAGE_SIZE):
-                self.buffer.append((line[start : start + MAX_MESSAGE_SIZE], mention))
+                chunks.append(line[start : start + MAX_MESSAGE_SIZE])
+
+        for idx, chunk in enumerate(chunks, 1):
+            self.buffer.append((chunk, mention, callback if idx == len(chunks) else None))
 
         if self.task.done():
             self.task = create_task(self._emit())
@@ -65,8 +85,9 @@ class Emitter:
     def stop(self) -> None:
         self.task.cancel()
 
-    def _get_message(self) -> tuple[str, discord.AllowedMentions]:
+    def _get_message(self) -> tuple[str, discord.AllowedMentions, list[Callback]]:
         parts: list[str] = []
+        callbacks: list[Callback] = []
         mentions: list[discord.abc.Snowflake | None] = []
 
         length: int = 0
@@ -79,12 +100,15 @@ class Emitter:
                 collecting = False
             else:
                 length += line_length + 1
-                content, mention = self.buffer.pop(0)
+                content, mention, callback = self.buffer.pop(0)
 
                 parts.append(content)
                 mentions.append(mention)
 
-        return '\n'.join(parts), discord.AllowedMentions(users=list(set(filter(None, mentions))))
+                if callback is not None:
+                    callbacks.append(callback)
+
+        return '\n'.join(parts), discord.AllowedMentions(users=list(set(filter(None, mentions)))), callbacks
 
     async def _emit(self) -> None:
         while self.buffer:
@@ -95,14 +119,28 @@ class Emitter:
             await asyncio.sleep(1 - passed if passed < 1 else 0.1)
 
             self.last_emit = time.perf_counter()
-            content, mentions = self._get_message()
+            content, mentions, callbacks = self._get_message()
 
             try:
                 await self.channel.send(content, silent=True, allowed_mentions=mentions)
             except discord.NotFound:  # :strawberrysad:
+                # Nothing queued for a deleted channel can ever be sent
+                callbacks.extend(x[2] for x in self.buffer if x[2] is not None)
+
+                self.buffer.clear()
                 self.stop()
             except (asyncio.TimeoutError, aiohttp.ClientError, discord.Forbidden, discord.DiscordServerError):
-                pass
+                for callback in callbacks:
+                    callback(False)
+
+                continue
             except discord.HTTPException as e:
                 if e.code != EMPTY_MESSAGE_ERROR:  # Discord rarely returns this despite content being present
+                    # Discord would reject the same content again
+                    for callback in callbacks:
+                        callback(True)
+
                     raise
+
+            for callback in callbacks:
+                callback(True)
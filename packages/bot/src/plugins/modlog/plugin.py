@@ -18,10 +18,12 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import aredis
 import discord
 
-from ... import NotFound, Plugin
+from ... import MODLOG_STREAMS, NotFound, Plugin
 from .emitter import Emitter, EmitterInactive
+from .stream import StreamDelivery
 
 
 def timestamp():
@@ -35,10 +37,18 @@ class ModLog(Plugin):
         self._configs = {}
         self._emitters = {}
 
+        if not MODLOG_STREAMS:
+            self._stream = None
+        else:
+            self._stream = StreamDelivery(mousey)
+
     def cog_unload(self):
         for emitter in self._emitters.values():
             emitter.stop()
 
+        if self._stream is not None:
+            self._stream.stop()
+
     async def log(self, guild, event, content, *, target=None):
         config = await self._get_config(guild)
         content = f'<t:{timestamp()}:T> {content}'
@@ -57,6 +67,14 @@ class ModLog(Plugin):
             else:
                 mention = target
 
+            if self._stream is not None:
+                try:
+                    await self._stream.publish(channel, content, mention)
+                except aredis.RedisError:
+                    pass  # Send directly instead, this line is not durable
+                else:
+                    continue
+
             try:
                 self._get_emitter(channel).send(content, mention)
             except EmitterInactive:  # Channel was deleted
@@ -96,6 +114,9 @@ class ModLog(Plugin):
     @Plugin.listener('on_mouse_guild_remove')
     @Plugin.listener('on_mouse_config_update')
     async def on_config_invalidate(self, event):
+        if getattr(event, 'kind', None) not in (None, 'modlogs'):
+            return  # A different part of the config changed
+
         try:
             del self._configs[event.guild.id]
         except KeyError:
@@ -109,6 +130,15 @@ class ModLog(Plugin):
             else:
                 emitter.stop()
 
+    @Plugin.listener()
+    async def on_mouse_config_reset(self):
+        self._configs.clear()
+
+        for emitter in self._emitters.values():
+            emitter.stop()
+
+        self._emitters.clear()
+
     @Plugin.listener()
     async def on_guild_channel_delete(self, channel):
         config = self._configs.get(channel.guild.id)
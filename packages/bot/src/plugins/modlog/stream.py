@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import functools
+import json
+import math
+import secrets
+import time
+
+import aredis
+import discord
+
+from ... import MODLOG_PARTITIONS, SHARD_COUNT, Mousey
+from ...utils import call_later, create_task
+from .emitter import Emitter, EmitterInactive
+
+
+GROUP = 'delivery'
+# Partitions only ever have a single owner, so every owner can use the same consumer name.
+# This way a new owner receives the pending entries of the previous one without XCLAIM.
+CONSUMER = 'owner'
+
+CLAIM_INTERVAL = 5
+CLAIM_EXPIRY = 10
+# Take over partitions above our fair share if nobody claimed them for this long
+ORPHAN_TIMEOUT = 30
+
+READ_COUNT = 100
+READ_BLOCK = 1000  # ms
+
+MAX_STREAM_LENGTH = 10_000
+
+# Wait before reading pending entries again after a send failed, to not hammer Discord while it fails
+REPLAY_DELAY = 30
+
+
+def partition_key(partition: int) -> str:
+    return f'mousey:modlog-partitions:{partition}'
+
+
+def stream_name(partition: int) -> str:
+    return f'mousey:modlog:{partition}'
+
+
+def get_partition(channel_id: int) -> int:
+    return channel_id % MODLOG_PARTITIONS
+
+
+class StreamDelivery:
+    """
+    Durable modlog delivery on top of Redis Streams.
+
+    Log lines are appended to one of MODLOG_PARTITIONS streams based on the channel ID.
+    Every partition is claimed by exactly one process at a time, similar to how shard IDs are claimed,
+    so only a single Emitter ever sends to a channel no matter how many processes are running.
+
+    Entries are only acknowledged once they have been sent, meaning whoever owns
+    a partition next continues delivering anything the previous owner did not get to.
+    Entries which failed to send are read again from the pending entries list after a delay.
+    """
+
+    def __init__(self, mousey: Mousey) -> None:
+        self.mousey: Mousey = mousey
+        self.token: bytes = secrets.token_hex(8).encode()
+
+        # Partitions we own, partitions whose pending entries have yet to be read
+        self._partitions: set[int] = set()
+        self._replay: set[int] = set()
+
+        self._emitters: dict[int, Emitter] = {}
+        self._acknowledged: collections.defaultdict[int, list[bytes]] = collections.defaultdict(list)
+
+        # Entries handed to an Emitter, and partitions which will be replayed after a failed send
+        self._queued: collections.defaultdict[int, set[bytes]] = collections.defaultdict(set)
+        self._replay_scheduled: set[int] = set()
+
+        self._unclaimed_since: dict[int, float] = {}
+
+        self._claim_task: asyncio.Task[None] = create_task(self._claim_partitions())
+        self._consume_task: asyncio.Task[None] = create_task(self._consume())
+
+    def stop(self) -> None:
+        self._claim_task.cancel()
+        self._consume_task.cancel()
+
+        for emitter in self._emitters.values():
+            emitter.stop()
+
+    async def publish(
+        self, channel: discord.abc.Snowflake, content: str, mention: discord.abc.Snowflake | None
+    ) -> None:
+        data = {'channel_id': channel.id, 'content': content, 'mention': mention and mention.id}
+        stream = stream_name(get_partition(channel.id))
+
+        await self.mousey.redis.xadd(stream, {'payload': json.dumps(data)}, max_len=MAX_STREAM_LENGTH)
+
+    # Partition ownership
+
+    async def _claim_partitions(self) -> None:
+        while True:
+            try:
+                await self._update_partitions()
+            except aredis.RedisError:
+                pass
+
+            await asyncio.sleep(CLAIM_INTERVAL)
+
+    async def _update_partitions(self) -> None:
+        redis = self.mousey.redis
+
+        fair_share = math.ceil(MODLOG_PARTITIONS / SHARD_COUNT)
+        owners = await redis.mget([partition_key(x) for x in range(MODLOG_PARTITIONS)])
+
+        now = time.monotonic()
+
+        for partition, owner in enumerate(owners):
+            key = partition_key(partition)
+
+            if partition in self._partitions:
+                if owner == self.token:
+                    await redis.set(key, self.token, ex=CLAIM_EXPIRY)
+                else:
+                    self._release_partition(partition)  # Our claim expired while we were busy
+
+                continue
+
+            if owner is not None:
+                self._unclaimed_since.pop(partition, None)
+                continue
+
+            unclaimed_since = self._unclaimed_since.setdefault(partition, now)
+
+            if len(self._partitions) >= fair_share and now - unclaimed_since < ORPHAN_TIMEOUT:
+                continue
+
+            if await redis.set(key, self.token, ex=CLAIM_EXPIRY, nx=True):
+                await self._ensure_group(partition)
+
+                self._replay.add(partition)
+                self._partitions.add(partition)
+
+                self._unclaimed_since.pop(partition, None)
+
+    def _release_partition(self, partition: int) -> None:
+        self._replay.discard(partition)
+        self._partitions.discard(partition)
+
+        # Unacknowledged entries are now delivered by the new owner
+        self._queued.pop(partition, None)
+        self._acknowledged.pop(partition, None)
+
+        for channel_id in tuple(self._emitters):
+            if get_partition(channel_id) == partition:
+                self._emitters.pop(channel_id).stop()
+
+    async def _ensure_group(self, partition: int) -> None:
+        try:
+            await self.mousey.redis.execute_command('XGROUP CREATE', stream_name(partition), GROUP, '0', 'MKSTREAM')
+        except aredis.ResponseError:
+            pass  # BUSYGROUP, the group already exists
+
+    # Delivery
+
+    async def _consume(self) -> None:
+        while True:
+            try:
+                await self._consume_once()
+            except aredis.RedisError:
+                await asyncio.sleep(READ_BLOCK / 1000)
+
+    async def _consume_once(self) -> None:
+        await self._flush_acknowledged()
+
+        for partition in tuple(self._replay):
+            await self._replay_pending(partition)
+
+        if not self._partitions:
+            await asyncio.sleep(READ_BLOCK / 1000)
+            return
+
+        streams = {stream_name(x): '>' for x in self._partitions}
+        resp = await self.mousey.redis.xreadgroup(GROUP, CONSUMER, count=READ_COUNT, block=READ_BLOCK, **streams)
+
+        for name, entries in (resp or {}).items():
+            partition = int(name.rsplit(b':', 1)[1])
+
+            for entry_id, fields in entries:
+                self._deliver(partition, entry_id, fields)
+
+    async def _replay_pending(self, partition: int) -> None:
+        last_id = '0'
+        stream = stream_name(partition)
+
+        while partition in self._replay:
+            resp = await self.mousey.redis.xreadgroup(GROUP, CONSUMER, count=READ_COUNT, **{stream: last_id})
+            entries = next(iter(resp.values()), []) if resp else []
+
+            if not entries:
+                self._replay.discard(partition)
+                return
+
+            for entry_id, fields in entries:
+                self._deliver(partition, entry_id, fields)
+
+            last_id = entries[-1][0]
+
+    async def _flush_acknowledged(self) -> None:
+        for partition in tuple(self._acknowledged):
+            entry_ids = self._acknowledged.pop(partition)
+
+            if entry_ids and partition in self._partitions:
+                await self.mousey.redis.execute_command('XACK', stream_name(partition), GROUP, *entry_ids)
+
+    def _on_sent(self, partition: int, entry_id: bytes, done: bool) -> None:
+        if partition not in self._partitions:
+            return
+
+        self._queued[partition].discard(entry_id)
+
+        if done:
+            # Look up the list now, since flushing replaces it
+            self._acknowledged[partition].append(entry_id)
+        elif partition not in self._replay_scheduled:
+            self._replay_scheduled.add(partition)
+            call_later(REPLAY_DELAY, self._schedule_replay, partition)
+
+    def _schedule_replay(self, partition: int) -> None:
+        self._replay_scheduled.discard(partition)
+
+        if partition in self._partitions:
+            self._replay.add(partition)
+
+    def _deliver(self, partition: int, entry_id: bytes, fields: dict[bytes, bytes]) -> None:
+        # Replaying reads entries which are still waiting to be sent as well
+        if partition not in self._partitions or entry_id in self._queued[partition]:
+            return
+
+        callback = functools.partial(self._on_sent, partition, entry_id)
+
+        if not fields:  # Entry was trimmed from the stream before it was delivered
+            callback(True)
+            return
+
+        data = json.loads(fields[b'payload'])
+
+        channel_id = data['channel_id']
+        mention = data['mention'] and discord.Object(id=data['mention'])
+
+        try:
+            self._get_emitter(channel_id).send(data['content'], mention, callback)
+        except EmitterInactive:  # Channel was deleted
+            callback(True)
+            del self._emitters[channel_id]
+        else:
+            self._queued[partition].add(entry_id)
+
+    def _get_emitter(self, channel_id: int) -> Emitter:
+        try:
+            return self._emitters[channel_id]
+        except KeyError:
+            pass
+
+        channel = self.mousey.get_partial_messageable(channel_id)
+        self._emitters[channel_id] = emitter = Emitter(channel)
+
+        return emitter
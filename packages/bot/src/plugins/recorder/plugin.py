@@ -146,11 +146,10 @@ class Recorder(Plugin):
         await self.log(member.guild, LogType.MEMBER_REMOVE, msg, target=discord.Object(id=member.id))
 
     async def _log_user_change(self, event: LogType, message: str, target: discord.User) -> None:
-        for guild in self.mousey.guilds:
-            member = guild.get_member(target.id)
+        members = self.mousey.get_cog('Members')
 
-            if member is not None:
-                await self.log(guild, event, message, target=member)
+        for member in members.mutual_members(target):
+            await self.log(member.guild, event, message, target=member)
 
     @Plugin.listener()
     async def on_user_update(self, before: discord.User, after: discord.User) -> None:
@@ -19,7 +19,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import collections
 import datetime
+import heapq
+import itertools
+import logging
 import math
 import re
 import typing
@@ -28,11 +32,28 @@ import aiohttp
 import discord
 from discord.ext import commands
 
-from ... import PURRL, NotFound, Plugin, bot_has_permissions, command, group
+from ... import PURRL, HTTPException, NotFound, Plugin, bot_has_permissions, command, group
 from ...utils import PaginatorInterface, Plural, TimeConverter, close_interface_context, create_task, serialize_user
 from .converter import reminder_content, reminder_id
 
 
+log = logging.getLogger(__name__)
+
+
+# Reminders due within this window are kept in memory
+PREFETCH_WINDOW = datetime.timedelta(hours=1)
+# Load the next window well before the current one runs out
+REFRESH_INTERVAL = datetime.timedelta(minutes=30)
+REFRESH_RETRY_DELAY = 5
+
+# Channels being sent reminders at once, each channel is sent one reminder at a time
+DELIVERY_CONCURRENCY = 10
+
+DELETE_DELAY = 1
+DELETE_BATCH_SIZE = 1000
+DELETE_MAX_RETRY_DELAY = 60
+
+
 def is_mentionable(role):
     return role.mentionable
 
@@ -41,12 +62,37 @@ class Reminders(Plugin):
     def __init__(self, mousey):
         super().__init__(mousey)
 
-        self._next = None
-        self._task = create_task(self._fulfill_reminders())
+        # Min-heap of (expires_at, id), entries which no longer match _reminders are skipped
+        self._heap = []
+        self._reminders = {}
+
+        # Reminders currently being sent, and IDs changed while the window is being loaded
+        self._in_flight = set()
+        self._modified = None
+
+        self._window_end = None
+        self._refresh_at = None
+
+        # Due reminders and the task sending them by destination channel or thread
+        self._channels = {}
+        self._deliveries = {}
+        self._semaphore = asyncio.Semaphore(DELIVERY_CONCURRENCY)
+
+        # Reminders which were sent and need to be deleted
+        self._delete_task = None
+        self._pending_deletes = set()
+
+        self._wakeup = asyncio.Event()
+        self._task = create_task(self._schedule_reminders())
 
     def cog_unload(self):
-        if not self._task.done():
-            self._task.cancel()
+        self._task.cancel()
+
+        if self._delete_task is not None:
+            self._delete_task.cancel()
+
+        for task in self._deliveries.values():
+            task.cancel()
 
     @group(aliases=['reminder', 'remindme'])
     @bot_has_permissions(send_messages=True)
@@ -91,9 +137,16 @@ class Reminders(Plugin):
         resp = await self.mousey.api.create_reminder(data)
         idx = resp['id']
 
-        if self._next is None or self._next > expires:
-            self._task.cancel()
-            self._task = create_task(self._fulfill_reminders())
+        reminder = {
+            'id': idx,
+            'user_id': ctx.author.id,
+            'thread_id': None,
+            'referenced_message_id': None,
+            **data,
+        }
+
+        del reminder['user']
+        self._schedule(reminder)
 
         about = f'about {message} ' if message else ''
         await ctx.send(f'I will remind you {about}{response}. #{idx}')
@@ -147,12 +200,9 @@ class Reminders(Plugin):
             await ctx.send('Unable to update reminder, it may have already expired before being edited.')
             return
 
+        self._schedule(resp)
         expires_at = math.floor(datetime.datetime.fromisoformat(resp['expires_at']).timestamp())
 
-        if self._next is not None:
-            self._task.cancel()
-            self._task = create_task(self._fulfill_reminders())
-
         await ctx.send(
             f'Successfully updated reminder #{reminder}, I will remind you <t:{expires_at}:R>.'
         )
@@ -230,107 +280,228 @@ class Reminders(Plugin):
                 pass
             else:
                 deleted += 1
+                self._unschedule(idx)
 
         if deleted:
-            if self._next is not None:
-                self._task.cancel()
-                self._task = create_task(self._fulfill_reminders())
-
             msg = f'Successfully deleted {Plural(deleted):reminder}.'
         else:
             msg = 'Unable to delete reminder, it may already be deleted or not belong to you.'
 
         await ctx.send(msg)
 
-    async def _fulfill_reminders(self):
+    def _schedule(self, reminder):
+        reminder = {**reminder, 'expires_at': datetime.datetime.fromisoformat(reminder['expires_at'])}
+        idx = reminder['id']
+
+        if self._modified is not None:
+            self._modified.add(idx)
+
+        if self._window_end is None or reminder['expires_at'] >= self._window_end:
+            self._reminders.pop(idx, None)  # Loaded again once it is inside the window
+            return
+
+        self._reminders[idx] = reminder
+        heapq.heappush(self._heap, (reminder['expires_at'], idx))
+
+        self._wakeup.set()
+
+    def _unschedule(self, idx):
+        if self._modified is not None:
+            self._modified.add(idx)
+
+        self._reminders.pop(idx, None)
+
+    async def _schedule_reminders(self):
         await self.mousey.wait_until_ready()
 
         while not self.mousey.is_closed():
+            if self._refresh_at is None or datetime.datetime.utcnow() >= self._refresh_at:
+                try:
+                    await self._refresh_reminders()
+                except (asyncio.TimeoutError, aiohttp.ClientError, HTTPException):
+                    await asyncio.sleep(REFRESH_RETRY_DELAY)
+                    continue
+                except Exception:
+                    log.exception('Unexpected exception loading reminders.')
+
+                    await asyncio.sleep(REFRESH_RETRY_DELAY)
+                    continue
+
+            self._wakeup.clear()
+
+            now = datetime.datetime.utcnow()
+            wake_at = self._refresh_at
+
+            while self._heap:
+                expires_at, idx = self._heap[0]
+                reminder = self._reminders.get(idx)
+
+                if reminder is None or reminder['expires_at'] != expires_at:
+                    heapq.heappop(self._heap)  # Cancelled or edited since being pushed
+                elif expires_at <= now:
+                    heapq.heappop(self._heap)
+                    self._fulfill_reminder(self._reminders.pop(idx))
+                else:
+                    wake_at = min(wake_at, expires_at)
+                    break
+
             try:
-                resp = await self.mousey.api.get_reminders(self.mousey.shard_id)
-            except NotFound:
-                return
-            except aiohttp.ClientError:
-                continue
+                await asyncio.wait_for(self._wakeup.wait(), (wake_at - now).total_seconds())
+            except asyncio.TimeoutError:
+                pass
 
-            reminder = resp[0]
-            expires_at = datetime.datetime.fromisoformat(reminder['expires_at'])
+    async def _refresh_reminders(self):
+        now = datetime.datetime.utcnow()
 
-            self._next = expires_at
-            await discord.utils.sleep_until(expires_at)
+        # Reminders created or edited from now on are scheduled against the new window,
+        # Local changes made while the request is in flight are more recent than its response
+        self._window_end = now + PREFETCH_WINDOW
+        self._modified = modified = set()
 
-            guild = self.mousey.get_guild(reminder['guild_id'])
+        try:
+            resp = await self.mousey.api.get_reminders(self.mousey.shard_id, before=self._window_end)
+        except NotFound:
+            resp = []
+        finally:
+            self._modified = None
 
-            if guild is None:
-                await asyncio.shield(self._delete_reminder(reminder['id']))
-                continue
+        reminders = {idx: x for idx, x in self._reminders.items() if idx in modified}
 
-            if guild.unavailable:
-                # Reschedule until the guild is hopefully available again
-                expires_at += datetime.timedelta(minutes=5)
-                await asyncio.shield(self._reschedule_reminder(reminder['id'], expires_at))
-                continue
+        for reminder in resp:
+            idx = reminder['id']
 
-            channel = guild.get_channel(reminder['channel_id'])
+            if idx not in modified and idx not in self._in_flight:
+                reminders[idx] = {**reminder, 'expires_at': datetime.datetime.fromisoformat(reminder['expires_at'])}
 
-            if channel is None or not channel.permissions_for(channel.guild.me).send_messages:
-                await asyncio.shield(self._delete_reminder(reminder['id']))
-                continue
+        self._reminders = reminders
+        self._refresh_at = now + REFRESH_INTERVAL
 
-            message_id = reminder['message_id']
+        self._heap = [(x['expires_at'], idx) for idx, x in reminders.items()]
+        heapq.heapify(self._heap)
 
-            created_at = discord.utils.snowflake_time(message_id)
+    def _fulfill_reminder(self, reminder):
+        # Stays in flight until it is deleted or rescheduled, so reloading the window does not send it again
+        self._in_flight.add(reminder['id'])
+        destination_id = reminder['thread_id'] or reminder['channel_id']
 
-            user_id = reminder['user_id']
-            content = reminder['message']
-            created = f'<t:{math.floor(created_at.timestamp())}>'
+        try:
+            self._channels[destination_id].append(reminder)
+        except KeyError:
+            self._channels[destination_id] = collections.deque([reminder])
+            self._deliveries[destination_id] = create_task(self._deliver_reminders(destination_id))
 
-            content = f'Hey <@!{user_id}> {PURRL}! You asked to be reminded about {content} at {created}.'
+    async def _deliver_reminders(self, destination_id):
+        queue = self._channels[destination_id]
 
-            member = guild.get_member(user_id)
+        async with self._semaphore:
+            while queue:
+                reminder = queue.popleft()
 
-            roles = re.findall(r'<@&?(\d{15,21})>', reminder['message'])
-            roles = filter(None, (guild.get_role(int(x)) for x in roles))
+                try:
+                    await self._send_reminder(reminder)
+                except Exception:
+                    log.exception(f'Unexpected exception sending reminder {reminder["id"]}.')
+                    self._in_flight.discard(reminder['id'])  # Retried once the window is loaded again
 
-            if member is None:
-                everyone = False
-                roles = list(filter(is_mentionable, roles))
-            else:
-                everyone = channel.permissions_for(member).mention_everyone
-                roles = [x for x in roles if everyone or is_mentionable(x)]
+        del self._channels[destination_id]
+        del self._deliveries[destination_id]
 
-            destination_id = reminder['thread_id'] or channel.id
+    async def _send_reminder(self, reminder):
+        expires_at = reminder['expires_at']
 
-            referenced_message_id = reminder['referenced_message_id'] or message_id
-            mentions = discord.AllowedMentions(everyone=everyone, roles=set(roles), users=True, replied_user=False)
+        guild = self.mousey.get_guild(reminder['guild_id'])
 
-            messageable = self.mousey.get_partial_messageable(destination_id)
-            reference = discord.MessageReference(message_id=referenced_message_id, channel_id=destination_id, fail_if_not_exists=False)
+        if guild is None:
+            self._queue_delete(reminder['id'])
+            return
 
-            try:
-                await messageable.send(content, allowed_mentions=mentions, reference=reference)
-            except discord.DiscordServerError:
-                expires_at += datetime.timedelta(minutes=5)
-                await asyncio.shield(self._reschedule_reminder(reminder['id'], expires_at))
-                continue
-            except discord.HTTPException as e:
-                pass
+        if guild.unavailable:
+            # Reschedule until the guild is hopefully available again
+            expires_at += datetime.timedelta(minutes=5)
+            await asyncio.shield(self._reschedule_reminder(reminder['id'], expires_at))
+            return
 
-            await asyncio.shield(self._delete_reminder(reminder['id']))
+        channel = guild.get_channel(reminder['channel_id'])
+
+        if channel is None or not channel.permissions_for(channel.guild.me).send_messages:
+            self._queue_delete(reminder['id'])
+            return
+
+        message_id = reminder['message_id']
+
+        created_at = discord.utils.snowflake_time(message_id)
+
+        user_id = reminder['user_id']
+        content = reminder['message']
+        created = f'<t:{math.floor(created_at.timestamp())}>'
+
+        content = f'Hey <@!{user_id}> {PURRL}! You asked to be reminded about {content} at {created}.'
+
+        member = guild.get_member(user_id)
+
+        roles = re.findall(r'<@&?(\d{15,21})>', reminder['message'])
+        roles = filter(None, (guild.get_role(int(x)) for x in roles))
+
+        if member is None:
+            everyone = False
+            roles = list(filter(is_mentionable, roles))
+        else:
+            everyone = channel.permissions_for(member).mention_everyone
+            roles = [x for x in roles if everyone or is_mentionable(x)]
 
-    async def _delete_reminder(self, idx):
-        self._next = None
+        destination_id = reminder['thread_id'] or channel.id
+
+        referenced_message_id = reminder['referenced_message_id'] or message_id
+        mentions = discord.AllowedMentions(everyone=everyone, roles=set(roles), users=True, replied_user=False)
+
+        messageable = self.mousey.get_partial_messageable(destination_id)
+        reference = discord.MessageReference(message_id=referenced_message_id, channel_id=destination_id, fail_if_not_exists=False)
 
         try:
-            await self.mousey.api.delete_reminder(idx)
-        except NotFound:
+            await messageable.send(content, allowed_mentions=mentions, reference=reference)
+        except discord.DiscordServerError:
+            expires_at += datetime.timedelta(minutes=5)
+            await asyncio.shield(self._reschedule_reminder(reminder['id'], expires_at))
+            return
+        except discord.HTTPException as e:
             pass
 
+        self._queue_delete(reminder['id'])
+
+    def _queue_delete(self, idx):
+        self._pending_deletes.add(idx)
+
+        if self._delete_task is None or self._delete_task.done():
+            self._delete_task = create_task(self._delete_pending_reminders())
+
+    async def _delete_pending_reminders(self):
+        await asyncio.sleep(DELETE_DELAY)
+
+        delay = DELETE_DELAY
+
+        while self._pending_deletes:
+            reminder_ids = list(itertools.islice(self._pending_deletes, DELETE_BATCH_SIZE))
+
+            try:
+                await self.mousey.api.delete_reminders(reminder_ids)
+            except (asyncio.TimeoutError, aiohttp.ClientError, HTTPException):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, DELETE_MAX_RETRY_DELAY)
+                continue
+
+            delay = DELETE_DELAY
+
+            self._in_flight.difference_update(reminder_ids)
+            self._pending_deletes.difference_update(reminder_ids)
+
     async def _reschedule_reminder(self, idx, expires_at):
-        self._next = None
-        expires_at = expires_at.isoformat()
+        data = {'expires_at': expires_at.isoformat()}
 
         try:
-            await self.mousey.api.update_reminder(idx, expires_at)
+            resp = await self.mousey.api.update_reminder(idx, data)
         except NotFound:
             pass
+        else:
+            self._schedule(resp)
+        finally:
+            self._in_flight.discard(idx)
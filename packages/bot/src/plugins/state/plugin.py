@@ -19,18 +19,36 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import collections
+import hashlib
+import itertools
+import json
 import typing
 
+import aiohttp
 import discord
 
-from ... import GuildChangeEvent, NotFound, Plugin
-from ...utils import serialize_user
+from ... import GuildChangeEvent, HTTPException, NotFound, Plugin
+from ...utils import create_task, serialize_user
 
 
 # Channel types Mousey uses
 _ChannelType = discord.ChannelType
 CHANNEL_TYPES = {_ChannelType.category, _ChannelType.text, _ChannelType.news, _ChannelType.voice, _ChannelType.forum}
 
+GUILD_SYNC_DELAY = 1
+GUILD_SYNC_BATCH_SIZE = 250
+
+USER_SYNC_DELAY = 5
+USER_SYNC_BATCH_SIZE = 1000
+USER_HASH_CACHE_SIZE = 50_000
+
+# Failed batches are retried with an exponential backoff
+SYNC_RETRY_DELAY = 5
+SYNC_MAX_RETRY_DELAY = 300
+
+SYNC_ERRORS = (asyncio.TimeoutError, aiohttp.ClientError, HTTPException)
+
 
 def serialize_role(role):
     data = {
@@ -53,6 +71,11 @@ def serialize_channel(channel):
     return data
 
 
+def content_hash(items):
+    data = json.dumps(sorted(items, key=lambda x: x['id']), separators=(',', ':'))
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
 class PartialGuild(typing.NamedTuple):
     id: int
 
@@ -67,6 +90,19 @@ class State(Plugin):
     def __init__(self, mousey):
         super().__init__(mousey)
 
+        # Guild data as last synced to the API, used to skip unchanged guilds
+        # Roles and channels are only compared using their content hashes
+        self._synced = None
+        self._synced_lock = asyncio.Lock()
+
+        self._sync_task = None
+        self._pending_guilds = {}
+
+        # Changed users are sent in batches, the hashes of users sent last are kept to skip repeats
+        self._user_sync_task = None
+        self._pending_users = {}
+        self._user_hashes = collections.OrderedDict()
+
         if mousey.is_ready():
             asyncio.create_task(self.on_ready())
 
@@ -75,17 +111,22 @@ class State(Plugin):
     @Plugin.listener()
     async def on_ready(self):
         # See which guilds we left while disconnected
+        await self._load_synced()
 
-        resp = await self.mousey.api.get_guilds(self.mousey.shard_id)
+        current = {x.id for x in self.mousey.guilds}
+        removed = {x: self._synced[x] for x in self._synced if x not in current}
 
-        for data in resp:
-            guild = self.mousey.get_guild(data['id'])
+        if not removed:
+            return
 
-            if guild is not None:
-                continue
+        for guild_id in removed:
+            del self._synced[guild_id]
 
-            guild = PartialGuild(**data)
-            await self.mousey.api.delete_guild(guild.id)
+        resp = await self.mousey.api.delete_guilds(list(removed))
+
+        for guild_id in resp['removed']:
+            data = removed[guild_id]
+            guild = PartialGuild(data['id'], data['name'], data['icon'])
 
             event = GuildChangeEvent(guild)
             self.mousey.dispatch('mouse_guild_remove', event)
@@ -93,33 +134,113 @@ class State(Plugin):
     @Plugin.listener('on_guild_join')
     @Plugin.listener('on_guild_available')
     async def on_guild_create(self, guild):
-        await self._update_guild(guild)
+        self._queue_guild(guild)
 
     @Plugin.listener()
     async def on_guild_update(self, before, after):
-        await self._update_guild(after)
+        self._queue_guild(after)
 
-    async def _update_guild(self, guild):
-        channels = [x for x in guild.channels if x.type in CHANNEL_TYPES]
+    def _queue_guild(self, guild):
+        # Guilds are synced in batches, as a whole shard becomes available on startup
+        self._pending_guilds[guild.id] = guild
 
-        data = {
-            'id': guild.id,
-            'name': guild.name,
-            'icon': guild.icon and guild.icon.key,
-            'roles': list(map(serialize_role, guild.roles)),
-            'channels': list(map(serialize_channel, channels)),
-        }
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = create_task(self._sync_pending_guilds())
 
-        resp = await self.mousey.api.create_guild(data)
+    async def _sync_pending_guilds(self):
+        await asyncio.sleep(GUILD_SYNC_DELAY)
 
-        if resp['created']:
-            event = GuildChangeEvent(guild)
+        delay = SYNC_RETRY_DELAY
+
+        while self._pending_guilds:
+            guild_ids = list(itertools.islice(self._pending_guilds, GUILD_SYNC_BATCH_SIZE))
+            guilds = [self._pending_guilds.pop(x) for x in guild_ids]
+
+            try:
+                await self._sync_guilds(guilds)
+            except SYNC_ERRORS:
+                for guild in guilds:
+                    # Guilds which were removed in the meantime are not synced anymore
+                    if self.mousey.get_guild(guild.id) is not None:
+                        self._pending_guilds.setdefault(guild.id, guild)
+
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, SYNC_MAX_RETRY_DELAY)
+            else:
+                delay = SYNC_RETRY_DELAY
+
+    async def _sync_guilds(self, guilds):
+        await self._load_synced()
+
+        states = {}
+        payload = []
+
+        for guild in guilds:
+            roles = list(map(serialize_role, guild.roles))
+            channels = [serialize_channel(x) for x in guild.channels if x.type in CHANNEL_TYPES]
+
+            state = {
+                'id': guild.id,
+                'name': guild.name,
+                'icon': guild.icon and guild.icon.key,
+                'roles_hash': content_hash(roles),
+                'channels_hash': content_hash(channels),
+            }
+
+            synced = self._synced.get(guild.id)
+
+            if synced == state:
+                continue
+
+            data = {'id': guild.id, 'name': state['name'], 'icon': state['icon']}
+
+            # Only send sections which changed since the last sync
+            if synced is None or synced['roles_hash'] != state['roles_hash']:
+                data.update(roles=roles, roles_hash=state['roles_hash'])
+
+            if synced is None or synced['channels_hash'] != state['channels_hash']:
+                data.update(channels=channels, channels_hash=state['channels_hash'])
+
+            payload.append(data)
+            states[guild.id] = state
+
+        if not payload:
+            return
+
+        resp = await self.mousey.api.create_guilds(payload)
+        self._synced.update(states)
+
+        guilds = {x.id: x for x in guilds}
+
+        for guild_id in resp['created']:
+            event = GuildChangeEvent(guilds[guild_id])
             self.mousey.dispatch('mouse_guild_join', event)
 
+    async def _load_synced(self):
+        async with self._synced_lock:
+            if self._synced is None:
+                try:
+                    resp = await self.mousey.api.get_guilds(self.mousey.shard_id)
+                except NotFound:  # No guilds have been synced for this shard yet
+                    resp = []
+
+                self._synced = {x['id']: x for x in resp}
+
+    def _invalidate_synced(self, guild_id, key):
+        # Individual updates clear the hash on the API side as well
+        try:
+            self._synced[guild_id][key] = None
+        except (KeyError, TypeError):
+            pass
+
     @Plugin.listener()
     async def on_guild_remove(self, guild):
+        self._pending_guilds.pop(guild.id, None)
         await self.mousey.api.delete_guild(guild.id)
 
+        if self._synced is not None:
+            self._synced.pop(guild.id, None)
+
         event = GuildChangeEvent(guild)
         self.mousey.dispatch('mouse_guild_remove', event)
 
@@ -136,6 +257,7 @@ class State(Plugin):
 
     async def _create_role(self, role):
         data = serialize_role(role)
+        self._invalidate_synced(role.guild.id, 'roles_hash')
 
         try:
             await self.mousey.api.create_role(role.guild.id, data)
@@ -144,6 +266,8 @@ class State(Plugin):
 
     @Plugin.listener()
     async def on_guild_role_delete(self, role):
+        self._invalidate_synced(role.guild.id, 'roles_hash')
+
         try:
             await self.mousey.api.delete_role(role.guild.id, role.id)
         except NotFound:
@@ -170,6 +294,7 @@ class State(Plugin):
 
     async def _create_channel(self, channel):
         data = serialize_channel(channel)
+        self._invalidate_synced(channel.guild.id, 'channels_hash')
 
         try:
             await self.mousey.api.create_channel(channel.guild.id, data)
@@ -178,6 +303,8 @@ class State(Plugin):
 
     @Plugin.listener()
     async def on_guild_channel_delete(self, channel):
+        self._invalidate_synced(channel.guild.id, 'channels_hash')
+
         try:
             await self.mousey.api.delete_channel(channel.guild.id, channel.id)
         except NotFound:
@@ -187,16 +314,50 @@ class State(Plugin):
 
     @Plugin.listener()
     async def on_member_join(self, member):
-        await self._update_user(member)
+        self._queue_user(member)
 
     @Plugin.listener()
     async def on_user_update(self, before, after):
-        await self._update_user(after)
+        self._queue_user(after)
 
-    async def _update_user(self, user):
+    def _queue_user(self, user):
         data = serialize_user(user)
+        content = hash(tuple(data.values()))
 
-        try:
-            await self.mousey.api.update_user(data)
-        except NotFound:
-            pass
+        # Skip users who have not changed since they were last sent
+        if self._user_hashes.get(user.id) == content:
+            return
+
+        self._pending_users[user.id] = data
+
+        if self._user_sync_task is None or self._user_sync_task.done():
+            self._user_sync_task = create_task(self._sync_pending_users())
+
+    async def _sync_pending_users(self):
+        await asyncio.sleep(USER_SYNC_DELAY)
+
+        delay = SYNC_RETRY_DELAY
+
+        while self._pending_users:
+            user_ids = list(itertools.islice(self._pending_users, USER_SYNC_BATCH_SIZE))
+            users = [self._pending_users.pop(x) for x in user_ids]
+
+            try:
+                await self.mousey.api.update_users(users)
+            except SYNC_ERRORS:
+                # Newer data which was queued in the meantime takes precedence
+                for data in users:
+                    self._pending_users.setdefault(data['id'], data)
+
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, SYNC_MAX_RETRY_DELAY)
+                continue
+
+            delay = SYNC_RETRY_DELAY
+
+            for data in users:
+                self._user_hashes[data['id']] = hash(tuple(data.values()))
+                self._user_hashes.move_to_end(data['id'])
+
+            while len(self._user_hashes) > USER_HASH_CACHE_SIZE:
+                self._user_hashes.popitem(last=False)
@@ -18,12 +18,15 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import collections
 import re
 from typing import Any, Dict
 
+import aiohttp
 import discord
 
-from ... import NotFound, Plugin
+from ... import HTTPException, NotFound, Plugin
 from ...utils import create_task
 from .buttons import RoleButtonAction, RoleChangeButton, RoleListButton
 from .view import TemplateView
@@ -58,12 +61,10 @@ class Templates(Plugin):
         super().__init__(mousey)
 
         self._active_channels = set()
+        self._shard_templates = None
 
-        if not mousey.is_ready():
-            return
-
-        for guild in mousey.guilds:
-            create_task(self.on_guild_available(guild))
+        if mousey.is_ready():
+            create_task(self._add_shard_templates())
 
     def cog_unload(self):
         for view in self.persisted_views():
@@ -87,11 +88,54 @@ class Templates(Plugin):
 
     @Plugin.listener()
     async def on_guild_available(self, guild):
+        if not self.mousey.is_ready():
+            # Guilds becoming available on startup share one request for the whole shard
+            if self._shard_templates is None:
+                self._shard_templates = asyncio.ensure_future(self._fetch_shard_templates())
+
+            future = self._shard_templates
+
+            try:
+                templates = await asyncio.shield(future)
+            except (asyncio.TimeoutError, aiohttp.ClientError, HTTPException):
+                # Fall back to the templates of this guild, the next guild retries the shard request
+                if self._shard_templates is future:
+                    self._shard_templates = None
+            else:
+                await self._add_templates(guild, templates.get(guild.id, []))
+                return
+
         try:
             data = await self.mousey.api.get_templates(guild.id)
         except NotFound:
             return
 
+        await self._add_templates(guild, data)
+
+    @Plugin.listener()
+    async def on_ready(self):
+        self._shard_templates = None  # Only needed until every guild became available
+
+    async def _fetch_shard_templates(self):
+        templates = collections.defaultdict(list)
+
+        try:
+            resp = await self.mousey.api.get_shard_templates(self.mousey.shard_id)
+        except NotFound:
+            return templates
+
+        for data in resp:
+            templates[data['guild_id']].append(data)
+
+        return templates
+
+    async def _add_shard_templates(self):
+        templates = await self._fetch_shard_templates()
+
+        for guild in self.mousey.guilds:
+            await self._add_templates(guild, templates.get(guild.id, []))
+
+    async def _add_templates(self, guild, data):
         for template in data:
             channel = guild.get_channel(template['channel_id'])
             await self.add_channel(channel, template['data'], update=False)
@@ -32,6 +32,10 @@ from ... import Plugin
 from ...utils import PGSQL_ARG_LIMIT, multirow_insert
 
 
+# Amount of members sent to the database in a single activity query
+INACTIVE_QUERY_CHUNK_SIZE = 10_000
+
+
 def not_bot(func):
     # fmt: off
     if not asyncio.iscoroutinefunction(func):
@@ -102,6 +106,46 @@ class Tracking(Plugin):
 
         return [LastMemberStatus(status_updates.get(x), seen_updates.get(x), spoke_updates.get(x)) for x in user_ids]
 
+    async def bulk_inactive(self, members, before, default, *, include_status=False):
+        """
+        Returns the IDs of members who were last seen in the guild at or before the given time.
+
+        Members who were never seen are treated as if they were last seen at default.
+        When include_status is set members must also not have been online since, and default is always considered.
+        """
+
+        if not members:
+            return set()
+
+        guild_id = members[0].guild.id
+
+        if include_status:
+            last_active = 'greatest(status_updates.updated_at, seen_updates.updated_at, $3)'
+        else:
+            last_active = 'coalesce(seen_updates.updated_at, $3)'
+
+        inactive = set()
+
+        async with self.mousey.db.acquire() as conn:
+            for chunk in more_itertools.chunked(members, INACTIVE_QUERY_CHUNK_SIZE):
+                records = await conn.fetch(
+                    f"""
+                    SELECT members.user_id
+                    FROM unnest($2::bigint[]) AS members (user_id)
+                    LEFT JOIN seen_updates ON seen_updates.guild_id = $1 AND seen_updates.user_id = members.user_id
+                    LEFT JOIN status_updates ON status_updates.user_id = members.user_id
+                    WHERE {last_active} <= $4
+                    """,
+                    guild_id,
+                    [x.id for x in chunk],
+                    default,
+                    before,
+                )
+
+                inactive.update(x['user_id'] for x in records)
+
+        return inactive
+
     async def get_removed_at(self, member):
         value = await self.mousey.redis.get(f'mousey:removed-at:{member.guild.id}-{member.id}')
 
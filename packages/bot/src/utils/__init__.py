@@ -19,6 +19,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 from .asyncio import call_later, create_task, set_none_result
+from .expiring import ExpiringDict, ExpiringSet
 from .formatting import Plural, code_safe, describe, describe_user, join_parts, user_name
 from .helpers import create_paste, has_membership_screening, populate_methods, serialize_user
 from .logging import setup_logging
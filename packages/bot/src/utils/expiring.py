@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import math
+import time
+
+from .asyncio import create_task
+
+
+_MISSING = object()
+
+
+class ExpiringDict:
+    """
+    A mapping whose keys are removed a fixed duration after being set.
+
+    Keys are sorted into buckets by the tick they expire in, and a single task removes a whole bucket per tick.
+    This avoids scheduling a timer per key when many short-lived keys are being tracked at once.
+
+    Keys may be removed up to one tick resolution later than their time to live.
+    The optional callback is called with the key and value of each expired item.
+    """
+
+    __slots__ = ('ttl', 'resolution', 'on_expire', '_data', '_buckets', '_swept', '_task')
+
+    def __init__(self, ttl, *, resolution=0.5, on_expire=None):
+        self.ttl = ttl
+        self.resolution = resolution
+        self.on_expire = on_expire
+
+        # key -> (value, tick the key expires in)
+        self._data = {}
+        # tick -> keys expiring in it, may contain keys which have since been set again
+        self._buckets = {}
+
+        self._swept = self._current_tick()
+        self._task = None
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        return self._data[key][0]
+
+    def __setitem__(self, key, value):
+        if self._task is None or self._task.done():
+            # Buckets left over from before the task last exited only hold keys which have been removed
+            self._buckets.clear()
+            self._swept = self._current_tick()
+
+            self._task = create_task(self._expire())
+
+        tick = math.ceil((time.monotonic() + self.ttl) / self.resolution)
+
+        self._data[key] = (value, tick)
+        self._buckets.setdefault(tick, []).append(key)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def get(self, key, default=None):
+        try:
+            return self._data[key][0]
+        except KeyError:
+            return default
+
+    def pop(self, key, default=_MISSING):
+        try:
+            return self._data.pop(key)[0]
+        except KeyError:
+            if default is _MISSING:
+                raise
+
+            return default
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _current_tick(self):
+        return math.floor(time.monotonic() / self.resolution)
+
+    async def _expire(self):
+        while self._data:
+            await asyncio.sleep(self.resolution)
+            current = self._current_tick()
+
+            while self._swept < current:
+                self._swept += 1
+
+                for key in self._buckets.pop(self._swept, ()):
+                    self._expire_key(key, self._swept)
+
+    def _expire_key(self, key, tick):
+        try:
+            value, expires = self._data[key]
+        except KeyError:
+            return
+
+        if expires != tick:
+            return  # Key was set again since
+
+        del self._data[key]
+
+        if self.on_expire is not None:
+            self.on_expire(key, value)
+
+
+class ExpiringSet:
+    """A set whose items are removed a fixed duration after being added, see ExpiringDict."""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, ttl, *, resolution=0.5):
+        self._data = ExpiringDict(ttl, resolution=resolution)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, item):
+        return item in self._data
+
+    def add(self, item):
+        self._data[item] = None
+
+    def discard(self, item):
+        self._data.pop(item, None)
+
+    def stop(self):
+        self._data.stop()
@@ -18,11 +18,18 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import functools
 import unicodedata
 
 import discord
 
 
+# Log lines repeatedly describe the same users, roles and channels.
+# Results only depend on the text, name, and discriminator passed in, so renamed users
+# simply miss the cache instead of requiring invalidation and old entries age out on their own.
+CACHE_SIZE = 8192
+
+
 def force_ltr(text):
     """Encapsulates a string to prevent RTL from messing up outside text."""
 
@@ -41,16 +48,26 @@ def remove_accents(text):
 def code_safe(text):
     """Shortcut to remove grave accents and encapsulate RTL text."""
 
+    return _code_safe(str(text))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _code_safe(text):
     return remove_accents(force_ltr(text))
 
 
 def user_name(user: discord.User) -> str:
     """Converts to a safe representation of the users DiscordTag."""
 
-    if user.discriminator == '0':  # Post pomelo transition user
-        return f'@{code_safe(user.name)}'
+    return _user_name(user.name, user.discriminator)
 
-    return f'{code_safe(user.name)}#{user.discriminator}'
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _user_name(name, discriminator):
+    if discriminator == '0':  # Post pomelo transition user
+        return f'@{code_safe(name)}'
+
+    return f'{code_safe(name)}#{discriminator}'
 
 
 def describe(item):
@@ -65,7 +82,12 @@ def describe(item):
 def describe_user(user):
     """Converts a user to their text representation."""
 
-    return f'{user_name(user)} {user.id}'
+    return _describe_user(user.id, user.name, user.discriminator)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _describe_user(user_id, name, discriminator):
+    return f'{_user_name(name, discriminator)} {user_id}'
 
 
 def join_parts(parts):
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mousey: Discord Moderation Bot
+Copyright (C) 2016 - 2021 Lilly Rose Berner
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Runs a modlog line through StreamDelivery against a real Redis server.
+
+Set REDIS_URL to a disposable Redis instance and run `python -m pytest tests` from packages/bot.
+"""
+
+import asyncio
+import os
+import types
+
+import pytest
+
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL is None:
+    pytest.skip('REDIS_URL is not set', allow_module_level=True)
+
+# Required to import the bot, a single partition is claimed immediately
+for name in ('API_URL', 'API_TOKEN', 'BOT_TOKEN', 'FERNET_KEY', 'PSQL_DSN'):
+    os.environ.setdefault(name, '')
+
+os.environ['SHARD_COUNT'] = '1'
+os.environ['MODLOG_PARTITIONS'] = '1'
+
+aredis = pytest.importorskip('aredis')
+discord = pytest.importorskip('discord')
+
+from src.plugins.modlog.stream import GROUP, StreamDelivery, partition_key, stream_name  # noqa: E402
+
+
+class Channel:
+    def __init__(self):
+        self.sent = asyncio.Queue()
+
+    async def send(self, content, **kwargs):
+        await self.sent.put(content)
+
+
+async def wait_for(predicate, timeout=15):
+    async def poll():
+        while not await predicate():
+            await asyncio.sleep(0.1)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def run_entry_through_stream():
+    redis = aredis.StrictRedis.from_url(REDIS_URL)
+    await redis.delete(stream_name(0), partition_key(0))
+
+    channel = Channel()
+    mousey = types.SimpleNamespace(redis=redis, get_partial_messageable=lambda channel_id: channel)
+
+    delivery = StreamDelivery(mousey)
+
+    try:
+        await delivery.publish(discord.Object(id=1234), 'Mousey was here', discord.Object(id=5678))
+        content = await asyncio.wait_for(channel.sent.get(), 15)
+
+        async def acknowledged():
+            pending = await redis.execute_command('XPENDING', stream_name(0), GROUP)
+            return pending[0] == 0
+
+        await wait_for(acknowledged)
+    finally:
+        delivery.stop()
+        await redis.delete(stream_name(0), partition_key(0))
+
+    return content
+
+
+def test_entry_is_delivered_and_acknowledged():
+    assert asyncio.run(run_entry_through_stream()) == 'Mousey was here'